@@ -1,8 +1,16 @@
 import os
+import io
 import json
+import bisect
+import functools
+import threading
+import uuid
 import logging
 from datetime import datetime
 from pathlib import Path
+from collections import defaultdict
+from operator import itemgetter
+from types import MappingProxyType
 from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 import chromadb
@@ -16,11 +24,14 @@ from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.dml.color import RGBColor
 from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.enum.text import PP_ALIGN
+from pptx.shapes.shapetree import SlideShapeFactory
 from PIL import Image
 import glob
 from dotenv import load_dotenv
 from rag_system import EnhancedDentalRAG
 from database_manager import PracticeDatabase
+from treatment_parser import enhanced_parse_treatment_text, is_valid_tooth_number
 from datetime import datetime, timedelta
 import sqlite3
 import html2text
@@ -28,6 +39,13 @@ import html2text
 # Load environment variables from .env file
 load_dotenv()
 
+# Debug logging for hot paths, enabled with DENTAL_DEBUG=1
+_log = logging.getLogger(__name__)
+_DEBUG = os.environ.get('DENTAL_DEBUG') == '1'
+if _DEBUG:
+    logging.basicConfig()
+    _log.setLevel(logging.DEBUG)
+
 app = Flask(__name__)
 CORS(app)
 
@@ -846,7 +864,7 @@ def schedule_treatment():
 def get_appointment_details(appointment_id):
     """Get detailed information about a specific appointment"""
     try:
-        conn = sqlite3.connect(practice_db.db_path)
+        conn = practice_db.connect_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -903,7 +921,7 @@ def move_appointment(appointment_id):
             }), 400
         
         # Get appointment details first
-        conn = sqlite3.connect(practice_db.db_path)
+        conn = practice_db.connect_sqlite()
         cursor = conn.cursor()
         
         cursor.execute('SELECT duration_minutes FROM appointments WHERE id = ?', (appointment_id,))
@@ -948,6 +966,7 @@ def move_appointment(appointment_id):
         
         conn.commit()
         conn.close()
+        practice_db.mark_schedule_changed()
         
         return jsonify({
             'success': True,
@@ -1005,9 +1024,7 @@ def chat():
         })
         
     except Exception as e:
-        print(f"❌ Error in chat endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        _log.exception("Error in chat endpoint: %s", e)
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
 @app.route('/api/schedule-chat', methods=['POST'])
@@ -1053,9 +1070,7 @@ def schedule_chat():
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"❌ Error in schedule chat endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        _log.exception("Error in schedule chat endpoint: %s", e)
         return jsonify({
             'success': False,
             'error': f'Désolé, une erreur s\'est produite: {str(e)}. Veuillez réessayer.',
@@ -1128,9 +1143,7 @@ def generate_autonomous_rescheduling_plan(analysis, user_message, schedule_conte
         return plan
         
     except Exception as e:
-        print(f"❌ Error generating autonomous plan: {e}")
-        import traceback
-        traceback.print_exc()
+        _log.exception("Error generating autonomous plan: %s", e)
         return {
             'success': False,
             'message': f'Erreur lors de la génération du plan: {str(e)}',
@@ -3133,105 +3146,13 @@ def get_patient_education():
         }), 500
 
 # PowerPoint Generation System
-# Enhanced treatment mappings - French dental terms to actions
-TREATMENT_MAPPINGS = {
-    # Color changes (crown, onlay, veneer)
-    'color_treatments': {
-        'cc': 'Couronne céramique',
-        'cci': 'Couronne sur implant',
-        'couronne': 'Couronne céramique',
-        'couronne ceramique': 'Couronne céramique',
-        'couronne sur implant': 'Couronne sur implant',
-        'onlay': 'Onlay',
-        'facette': 'Facette céramique',
-        'facette ceramique': 'Facette céramique',
-        'veneer': 'Facette céramique',
-        'f': 'Facette céramique',
-        'cpr': 'Couronne céramique',
-        'o': 'Onlay',
-        'ceram': 'Facette céramique',
-        'ceramique': 'Facette céramique'
-    },
-    # Icon treatments
-    'icon_treatments': {
-        'dem': 'Dévitalisation',
-        'dém': 'Dévitalisation',
-        'devitalisation': 'Dévitalisation',
-        'dévitalisation': 'Dévitalisation',
-        'tr': 'Traitement endodontique',
-        'traitement radiculaire': 'Traitement endodontique',
-        'traitement endodontique': 'Traitement endodontique',
-        'endo': 'Traitement endodontique',
-        'endodontie': 'Traitement endodontique',
-        'tenons': 'Tenons',
-        'tenon': 'Tenons',
-        'ma': 'Moignon adhésif',
-        'moignon adhesif': 'Moignon adhésif',
-        'moignon adhésif': 'Moignon adhésif',
-        'extraction': 'Extraction',
-        'ext': 'Extraction',
-        'av': 'Extraction',
-        'avulsion': 'Extraction',
-        'abl': 'Extraction',
-        'ablation': 'Extraction',
-        'implant': 'Pose d\'implant',
-        'imp': 'Pose d\'implant',
-        'pose i': 'Pose d\'implant',
-        'pose d\'implant': 'Pose d\'implant',
-        'pose implant': 'Pose d\'implant',
-        'curtage': 'Curetage',
-        'curetage': 'Curetage',
-        'seance': 'Séance',
-        'séance': 'Séance',
-        'bnv': 'Blanchissement interne',
-        'blanchiment interne': 'Blanchissement interne',
-        'blanchissement interne': 'Blanchissement interne',
-        'blanch': 'Blanchissement interne',
-        'blanchiment': 'Blanchissement interne',
-        'gbr': 'Greffe osseuse',
-        'greffe osseuse': 'Greffe osseuse',
-        'gc': 'Greffe gingivale',
-        'greffe gingivale': 'Greffe gingivale',
-        'sl': 'Sinus lift',
-        'sinus lift': 'Sinus lift',
-        'det': 'Détartrage',
-        'hd': 'Détartrage',
-        'détartrage': 'Détartrage',
-        'detartrage': 'Détartrage',
-        'sf': 'Scellement de fissure',
-        'scellement de fissure': 'Scellement de fissure',
-        'dds': 'Dent de sagesse',
-        'dent de sagesse': 'Dent de sagesse',
-        'fil de cont': 'Fil de contention',
-        'fil de contention': 'Fil de contention',
-        'dem cc': 'Démonter couronne',
-        'dém cc': 'Démonter couronne',
-        'te': 'Taille empreinte',
-        'taille empreinte': 'Taille empreinte',
-        'sc': 'Scellement',
-        'scellement': 'Scellement',
-        'empr': 'Empreinte',
-        'empreinte': 'Empreinte',
-        'post-op': 'Post opératoire',
-        'post op': 'Post opératoire',
-        'prov': 'Provisoire',
-        'provisoire': 'Provisoire',
-        'm': 'Composite mésial',
-        'mesial': 'Composite mésial',
-        'mésial': 'Composite mésial',
-        'd': 'Composite distal',
-        'distal': 'Composite distal',
-        'mo': 'Composite mésio-occlusal',
-        'do': 'Composite occluso-distal',
-        'mod': 'Composite mésio-occluso-distal',
-        'l': 'Composite lingual',
-        'lingual': 'Composite lingual',
-        'p': 'Composite palatin',
-        'palatin': 'Composite palatin',
-        'v': 'Composite vestibulaire',
-        'vestibulaire': 'Composite vestibulaire'
-    }
+# PresentationML / DrawingML namespaces for raw XML shape lookups
+_NSMAP = {
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'
 }
+_SP_TAG = '{%s}sp' % _NSMAP['p']
+_GRPSP_TAG = '{%s}grpSp' % _NSMAP['p']
 
 # Treatment colors
 TREATMENT_COLORS = {
@@ -3241,112 +3162,30 @@ TREATMENT_COLORS = {
     'Facette céramique': RGBColor(0, 123, 255)  # Blue
 }
 
-def parse_tooth_range(tooth_str):
-    """Parse tooth ranges like '12-22' or '11 à 22'"""
-    tooth_str = tooth_str.strip()
-    
-    # Handle ranges with dash: 12-22
-    if '-' in tooth_str:
-        start, end = tooth_str.split('-')
-        start, end = int(start.strip()), int(end.strip())
-        return list(range(start, end + 1))
-    
-    # Handle ranges with 'à': 11 à 22
-    elif ' à ' in tooth_str:
-        start, end = tooth_str.split(' à ')
-        start, end = int(start.strip()), int(end.strip())
-        return list(range(start, end + 1))
-    
-    # Single tooth
-    else:
-        return [int(tooth_str)]
-
-def enhanced_parse_treatment_text(text):
-    """Enhanced parsing with better regex"""
-    results = []
-    
-    # Clean the text
-    text = text.lower().strip()
-    
-    # Enhanced regex patterns
-    patterns = [
-        # Complex pattern: Plan de TT 11 AV + implant + CC; 22 Implant + CC
-        r'plan\s+de\s+t+\s+([^;]+)',
-        # Simple pattern: 26 dém. CC + dém. tenons + TR
-        r'(\d+(?:\s*[-à]\s*\d+)?)\s*[:\s]*([^;]+)',
-        # Alternative pattern: Pour la 26: treatments
-        r'pour\s+la\s+(\d+(?:\s*[-à]\s*\d+)?)\s*[:\s]*([^;]+)',
-    ]
+def _build_shape_index(slide):
+    """Index slide shapes by name (and text) straight from the raw spTree XML"""
+    names = {}
+    texts = []
     
-    for pattern in patterns:
-        matches = re.findall(pattern, text)
-        for match in matches:
-            if len(match) == 2:
-                tooth_part, treatment_part = match
-                
-                # Parse tooth numbers (handle ranges)
-                try:
-                    tooth_numbers = parse_tooth_range(tooth_part)
-                except ValueError:
-                    continue
-                
-                # Parse treatments
-                treatments = [t.strip() for t in re.split(r'[+&,]', treatment_part) if t.strip()]
-                
-                for tooth_num in tooth_numbers:
-                    for treatment in treatments:
-                        treatment = treatment.strip()
-                        if treatment:
-                            # Determine treatment type and normalize name
-                            normalized_treatment = None
-                            treatment_type = 'icon'  # default
-                            
-                            # Check color treatments first
-                            for key, value in TREATMENT_MAPPINGS['color_treatments'].items():
-                                if key in treatment:
-                                    normalized_treatment = value
-                                    treatment_type = 'color'
-                                    break
-                            
-                            # Check icon treatments if not found in color treatments
-                            if not normalized_treatment:
-                                for key, value in TREATMENT_MAPPINGS['icon_treatments'].items():
-                                    if key in treatment:
-                                        normalized_treatment = value
-                                        treatment_type = 'icon'
-                                        break
-                            
-                            # If no mapping found, use original treatment
-                            if not normalized_treatment:
-                                normalized_treatment = treatment.title()
-                            
-                            results.append({
-                                'tooth': str(tooth_num),
-                                'treatment': normalized_treatment,
-                                'type': treatment_type,
-                                'original': treatment
-                            })
+    # One pass over the lxml tree instead of python-pptx property descriptors
+    for element in slide.shapes._spTree.iter(_SP_TAG, _GRPSP_TAG):
+        c_nv_pr = element.find('./*/p:cNvPr', _NSMAP)
+        if c_nv_pr is not None:
+            names.setdefault(c_nv_pr.get('name'), element)
+        
+        if element.tag == _SP_TAG:
+            paragraphs = element.findall('./p:txBody/a:p', _NSMAP)
+            if paragraphs:
+                text = '\n'.join(''.join(paragraph.itertext()) for paragraph in paragraphs)
+                texts.append((text, element))
     
-    return results
-
-def is_valid_tooth_number(tooth_number):
-    """Validate tooth number according to FDI system"""
-    try:
-        tooth_num = int(tooth_number)
-        # Valid FDI tooth numbers: 11-18, 21-28, 31-38, 41-48
-        valid_ranges = [
-            (11, 18), (21, 28), (31, 38), (41, 48)
-        ]
-        
-        for start, end in valid_ranges:
-            if start <= tooth_num <= end:
-                return True
-        return False
-    except ValueError:
-        return False
+    return {'names': names, 'texts': texts}
 
-def find_tooth_element(slide, tooth_number):
+def find_tooth_element(slide, tooth_number, shape_idx=None):
     """Find the tooth element in the slide by searching for tooth name patterns"""
+    if shape_idx is None:
+        shape_idx = _build_shape_index(slide)
+    
     target_names = [
         f"tooth_{tooth_number}",
         f"Tooth_{tooth_number}",
@@ -3358,31 +3197,32 @@ def find_tooth_element(slide, tooth_number):
         f"Dent_{tooth_number}"
     ]
     
-    def search_in_shapes(shapes):
-        # First, check direct shapes by name (faster and more accurate)
-        for shape in shapes:
-            if hasattr(shape, 'name') and shape.name in target_names:
-                return shape
-        
-        # Then check grouped shapes
-        for shape in shapes:
-            if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
-                result = search_in_shapes(shape.shapes)
-                if result:
-                    return result
-        
-        # Fallback: check if tooth number appears in shape text
-        for shape in shapes:
-            if hasattr(shape, 'text') and str(tooth_number) in shape.text:
-                return shape
-        
+    element = None
+    
+    # First, check shapes by name (faster and more accurate)
+    for name in target_names:
+        element = shape_idx['names'].get(name)
+        if element is not None:
+            break
+    
+    # Fallback: check if tooth number appears in shape text
+    if element is None:
+        tooth_str = str(tooth_number)
+        for text, text_element in shape_idx['texts']:
+            if tooth_str in text:
+                element = text_element
+                break
+    
+    if element is None:
         return None
     
-    return search_in_shapes(slide.shapes)
+    # Only materialize the python-pptx wrapper for the shape we actually mutate
+    return SlideShapeFactory(element, slide.shapes)
 
-def apply_color_treatment(slide, tooth_number, treatment):
+def apply_color_treatment(slide, tooth_number, treatment, tooth_element=None):
     """Apply color treatment to a tooth with enhanced error handling"""
-    tooth_element = find_tooth_element(slide, tooth_number)
+    if tooth_element is None:
+        tooth_element = find_tooth_element(slide, tooth_number)
     
     if not tooth_element:
         return False
@@ -3463,13 +3303,14 @@ def apply_color_treatment(slide, tooth_number, treatment):
         return False
         
     except Exception as e:
-        print(f"Error applying color to tooth {tooth_number}: {e}")
+        _log.error("Error applying color to tooth %s: %s", tooth_number, e)
         return False
 
-def apply_multiple_icon_treatments(slide, tooth_number, treatments):
+def apply_multiple_icon_treatments(slide, tooth_number, treatments, tooth_element=None):
     """Apply multiple icon treatments to a tooth with smart positioning"""
     try:
-        tooth_element = find_tooth_element(slide, tooth_number)
+        if tooth_element is None:
+            tooth_element = find_tooth_element(slide, tooth_number)
         if not tooth_element:
             return [False] * len(treatments)
         
@@ -3533,7 +3374,8 @@ def apply_multiple_icon_treatments(slide, tooth_number, treatments):
                 
                 if icon_path and os.path.exists(icon_path):
                     try:
-                        print(f"Adding icon for {treatment}: {icon_path}")
+                        if _DEBUG:
+                            _log.debug("Adding icon for %s: %s", treatment, icon_path)
                         # Add the icon image
                         pic = slide.shapes.add_picture(
                             icon_path,
@@ -3543,14 +3385,16 @@ def apply_multiple_icon_treatments(slide, tooth_number, treatments):
                             height=icon_size
                         )
                         success = True
-                        print(f"✅ Successfully added icon for {treatment}")
+                        if _DEBUG:
+                            _log.debug("Successfully added icon for %s", treatment)
                     except Exception as e:
-                        print(f"❌ Error adding icon image for {treatment}: {e}")
+                        _log.warning("Error adding icon image for %s: %s", treatment, e)
                         # Fall back to text if image fails
                         pass
                 
                 if not success:
-                    print(f"Using text fallback for {treatment}")
+                    if _DEBUG:
+                        _log.debug("Using text fallback for %s", treatment)
                     # Fallback to text
                     text_box = slide.shapes.add_textbox(x, y, icon_size, icon_size)
                     
@@ -3618,7 +3462,6 @@ def apply_multiple_icon_treatments(slide, tooth_number, treatments):
                     paragraph.font.color.rgb = RGBColor(255, 0, 0)  # Red
                     
                     # Center the text
-                    from pptx.enum.text import PP_ALIGN
                     paragraph.alignment = PP_ALIGN.CENTER
                     
                     success = True
@@ -3626,13 +3469,13 @@ def apply_multiple_icon_treatments(slide, tooth_number, treatments):
                 results.append(success)
                 
             except Exception as e:
-                print(f"Icon treatment error for tooth {tooth_number}, treatment {treatment}: {e}")
+                _log.error("Icon treatment error for tooth %s, treatment %s: %s", tooth_number, treatment, e)
                 results.append(False)
         
         return results
         
     except Exception as e:
-        print(f"Multiple icon treatment error for tooth {tooth_number}: {e}")
+        _log.error("Multiple icon treatment error for tooth %s: %s", tooth_number, e)
         return [False] * len(treatments)
 
 def apply_icon_treatment(slide, tooth_number, treatment):
@@ -3659,7 +3502,7 @@ def debug_slide_shapes(slide):
                 shape_info['text'] = shape.text[:50] if shape.text else ''
             
             shapes_info.append(shape_info)
-            print(f"{indent}Shape {i}: {shape_info['name']} (type: {shape_info['type']})")
+            _log.debug("%sShape %d: %s (type: %s)", indent, i, shape_info['name'], shape_info['type'])
             
             # If it's a group, recurse
             if hasattr(shape, 'shapes'):
@@ -3668,15 +3511,58 @@ def debug_slide_shapes(slide):
     collect_shapes(slide.shapes)
     return shapes_info
 
+# Generated presentations kept in memory until downloaded: token -> (bytes, created_at)
+# Guarded by _PPTX_CACHE_LOCK since the server runs threaded
+_PPTX_CACHE: dict[str, tuple[bytes, datetime]] = {}
+_PPTX_CACHE_LOCK = threading.Lock()
+_PPTX_CACHE_TTL = timedelta(minutes=10)
+_PPTX_CACHE_MAX = 32
+
+def _sweep_pptx_cache():
+    """Drop generated presentations older than the cache TTL (caller holds the lock)"""
+    cutoff = datetime.utcnow() - _PPTX_CACHE_TTL
+    for token, (_, created_at) in list(_PPTX_CACHE.items()):
+        if created_at < cutoff:
+            _PPTX_CACHE.pop(token, None)
+
+def _store_pptx(data: bytes) -> str:
+    """Cache a generated presentation and return its download token"""
+    token = uuid.uuid4().hex
+    with _PPTX_CACHE_LOCK:
+        _sweep_pptx_cache()
+        # Evict the oldest entries (dicts keep insertion order) to bound memory
+        while len(_PPTX_CACHE) >= _PPTX_CACHE_MAX:
+            _PPTX_CACHE.pop(next(iter(_PPTX_CACHE)))
+        _PPTX_CACHE[token] = (data, datetime.utcnow())
+    return token
+
+def _get_pptx(token: str):
+    """Return (bytes, created_at) for a live download token, or None"""
+    with _PPTX_CACHE_LOCK:
+        _sweep_pptx_cache()
+        return _PPTX_CACHE.get(token)
+
+# PowerPoint template bytes, read from disk once and parsed per request
+_TEMPLATE_PATH = 'plan.pptx'
+_TEMPLATE_BYTES = None
+
+def _get_template_bytes():
+    """Return the cached template bytes, loading them on first use"""
+    global _TEMPLATE_BYTES
+    if _TEMPLATE_BYTES is None and os.path.exists(_TEMPLATE_PATH):
+        with open(_TEMPLATE_PATH, 'rb') as f:
+            _TEMPLATE_BYTES = f.read()
+    return _TEMPLATE_BYTES
+
 def process_powerpoint_treatments(treatments):
     """Process the PowerPoint with the given treatments"""
     try:
         # Load the PowerPoint template
-        template_path = 'plan.pptx'
-        if not os.path.exists(template_path):
+        template_bytes = _get_template_bytes()
+        if template_bytes is None:
             return None, "Template PowerPoint file not found"
         
-        prs = Presentation(template_path)
+        prs = Presentation(io.BytesIO(template_bytes))
         
         results = []
         
@@ -3684,13 +3570,17 @@ def process_powerpoint_treatments(treatments):
         if prs.slides:
             slide = prs.slides[0]
             
-            # Debug: Print all shapes in the slide
-            print("=== DEBUG: Slide shapes ===")
-            debug_slide_shapes(slide)
-            print("=== END DEBUG ===")
+            # Debug: Log all shapes in the slide
+            if _DEBUG:
+                _log.debug("=== DEBUG: Slide shapes ===")
+                debug_slide_shapes(slide)
+                _log.debug("=== END DEBUG ===")
+            
+            # Index the slide shapes once for all tooth lookups
+            shape_idx = _build_shape_index(slide)
             
             # Group treatments by tooth and type
-            tooth_treatments = {}
+            tooth_treatments = defaultdict(lambda: {'color': [], 'icon': []})
             
             for treatment in treatments:
                 tooth = treatment['tooth']
@@ -3705,25 +3595,23 @@ def process_powerpoint_treatments(treatments):
                     })
                     continue
                 
-                if tooth not in tooth_treatments:
-                    tooth_treatments[tooth] = {'color': [], 'icon': []}
-                
                 tooth_treatments[tooth][treatment['type']].append(treatment)
             
             # Process each tooth's treatments
             for tooth, treatments_by_type in tooth_treatments.items():
-                print(f"Processing tooth {tooth}...")
+                tooth_element = find_tooth_element(slide, tooth, shape_idx)
                 
-                # Try to find the tooth element for debugging
-                tooth_element = find_tooth_element(slide, tooth)
-                if tooth_element:
-                    print(f"Found tooth element for {tooth}: {tooth_element.name}")
-                else:
-                    print(f"Could not find tooth element for {tooth}")
+                if _DEBUG:
+                    _log.debug("Processing tooth %s...", tooth)
+                    if tooth_element:
+                        _log.debug("Found tooth element for %s: %s", tooth, tooth_element.name)
+                    else:
+                        _log.debug("Could not find tooth element for %s", tooth)
                 
                 # Apply color treatments first (they don't stack)
                 for color_treatment in treatments_by_type['color']:
-                    success = apply_color_treatment(slide, tooth, color_treatment['treatment'])
+                    success = apply_color_treatment(slide, tooth, color_treatment['treatment'],
+                                                    tooth_element=tooth_element)
                     results.append({
                         'tooth': tooth,
                         'treatment': color_treatment['treatment'],
@@ -3734,7 +3622,8 @@ def process_powerpoint_treatments(treatments):
                 # Apply all icon treatments for this tooth at once (with smart positioning)
                 if treatments_by_type['icon']:
                     icon_treatments = [t['treatment'] for t in treatments_by_type['icon']]
-                    success_list = apply_multiple_icon_treatments(slide, tooth, icon_treatments)
+                    success_list = apply_multiple_icon_treatments(slide, tooth, icon_treatments,
+                                                                  tooth_element=tooth_element)
                     
                     for i, (icon_treatment, success) in enumerate(zip(treatments_by_type['icon'], success_list)):
                         results.append({
@@ -3744,20 +3633,16 @@ def process_powerpoint_treatments(treatments):
                             'error': f"Impossible d'ajouter l'icône sur la dent {tooth}" if not success else None
                         })
         
-        # Save the modified presentation
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_filename = f"plan_modified_{timestamp}.pptx"
-        
-        # Create temp directory if it doesn't exist
-        os.makedirs('temp', exist_ok=True)
-        output_path = os.path.join('temp', output_filename)
+        # Save the modified presentation in memory for the download endpoint
+        buffer = io.BytesIO()
+        prs.save(buffer)
         
-        prs.save(output_path)
+        token = _store_pptx(buffer.getvalue())
         
-        return output_filename, results
+        return token, results
         
     except Exception as e:
-        print(f"PowerPoint processing error: {e}")
+        _log.error("PowerPoint processing error: %s", e)
         return None, str(e)
 
 @app.route('/api/process-powerpoint', methods=['POST'])
@@ -3792,16 +3677,19 @@ def process_powerpoint():
         print(f"Error in process_powerpoint: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/download-powerpoint/<filename>')
-def download_powerpoint(filename):
+@app.route('/api/download-powerpoint/<token>')
+def download_powerpoint(token):
     """Download the generated PowerPoint file"""
     try:
-        file_path = os.path.join('temp', filename)
-        if not os.path.exists(file_path):
+        cached = _get_pptx(token)
+        if not cached:
             return jsonify({'error': 'File not found'}), 404
         
+        data, created_at = cached
+        filename = f"plan_modified_{created_at.strftime('%Y%m%d_%H%M%S')}.pptx"
+        
         return send_file(
-            file_path,
+            io.BytesIO(data),
             as_attachment=True,
             download_name=filename,
             mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation'
@@ -3898,107 +3786,228 @@ def get_icon_path(treatment):
     
     return None
 
+# French duration ("45 min", "1.5h") and delay ("2 semaines") parsers
+_DUR_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(min|h)', re.I)
+_DUR_MULT = {'min': 1, 'h': 60}
+_DELAY_RE = re.compile(r'(\d+)\s*(jour|semaine|mois)', re.I)
+_DELAY_MULT = {'jour': 1, 'semaine': 7, 'mois': 30}
+
+@functools.lru_cache(maxsize=128)
+def _parse_duration_str(duration_str):
+    m = _DUR_RE.search(duration_str)
+    return int(float(m.group(1)) * _DUR_MULT[m.group(2).lower()]) if m else 60
+
+@functools.lru_cache(maxsize=128)
+def _parse_delay_str(delay_str):
+    m = _DELAY_RE.search(delay_str)
+    return int(m.group(1)) * _DELAY_MULT[m.group(2).lower()] if m else 7
+
+def _parse_duration_minutes(duration_str):
+    """Parse duration string to minutes (60 if unparseable)"""
+    # LLM replies may hold lists or dicts here, which the cache cannot hash
+    return _parse_duration_str(duration_str) if isinstance(duration_str, str) else 60
+
+def _parse_delay_to_days(delay_str):
+    """Parse delay string to days (7 if unparseable)"""
+    return _parse_delay_str(delay_str) if isinstance(delay_str, str) else 7
+
+def _normalize_llm_response(raw):
+    """Coerce a parsed LLM scheduling reply to the shape the scheduler relies on.
+    
+    priority_notes and summary_points become lists of strings so the
+    reasoning and summary builders need no per-item type checks.
+    """
+    if not isinstance(raw, dict):
+        if _DEBUG:
+            _log.debug("LLM response is not a dict, got %s: %s", type(raw), raw)
+        raw = {}
+    
+    normalized = dict(raw)
+    for key in ('priority_notes', 'summary_points'):
+        items = raw.get(key)
+        if not isinstance(items, list):
+            items = []
+        normalized[key] = [item for item in items if isinstance(item, str)]
+        if _DEBUG and len(normalized[key]) != len(items):
+            _log.debug("Dropped non-string %s: %s", key, items)
+    return normalized
+
+# Fallback classification; classifications are normalized once in apply_llm_recommendations
+_DEFAULT_CLASSIFICATION = MappingProxyType({
+    "category": "routine_treatments",
+    "preferred_time": "afternoon",
+    "duration_buffer": 10,
+    "special_requirements": MappingProxyType({})
+})
+
+# JSON object inside a ```json (or untagged) markdown fence in LLM replies
+_JSON_FENCE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+
+# Minutes since midnight for every quarter-hour "HH:MM" string
+_TIME_TO_MIN = {f"{h:02d}:{m:02d}": h * 60 + m for h in range(24) for m in (0, 15, 30, 45)}
+
+# Leading YYYY-MM-DD of a patient's birth date
+_BIRTH_DATE_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+# Appointments starting before noon count as morning
+_NOON = '12:00'
+
+# Age brackets for patient time preferences: <=18, 19-24, 25-55, 56-64, >=65
+_AGE_BUCKETS = (18, 24, 55, 64)
+_AGE_PREFS = (
+    ("afternoon", "Young patient - afternoon preferred"),
+    (None, None),
+    ("early_morning_or_evening", "Working adult - early morning or evening preferred"),
+    (None, None),
+    ("morning", "Elderly patient - morning preferred")
+)
+
+# Clock time used for each preferred time-of-day
+_PREF_TIME_TO_CLOCK = {
+    'morning': '09:00',
+    'afternoon': '14:00',
+    'early_morning_or_evening': '08:00',
+    'any': '09:00'
+}
+
+# Days to add to reach the next working day, indexed by weekday (Mon=0..Sun=6)
+_SKIP_WEEKEND = (0, 0, 0, 0, 0, 2, 1)
+_AVOID_FRI_SURG = (0, 0, 0, 0, 3, 2, 1)
+
+# Categories counted as surgical load in schedule analysis
+_SURGICAL_CATS = frozenset({"surgical_treatments", "endodontic_treatments"})
+
+# Dentist scheduling preferences and per-category treatment rules, shared
+# read-only by every scheduler instance
+_DENTIST_PREFERENCES = MappingProxyType({
+    "working_days": ["monday", "tuesday", "wednesday", "thursday", "friday"],
+    "working_hours": {
+        "start": "08:00",
+        "end": "18:00",
+        "lunch_break": {"start": "12:00", "end": "13:00"}
+    },
+    "preferred_schedules": {
+        "surgeries": "morning",  # Prefer surgeries in the morning
+        "consultations": "afternoon",  # Prefer consultations in the afternoon
+        "long_procedures": "morning",  # Long procedures in the morning when fresh
+        "follow_ups": "afternoon"  # Follow-ups in the afternoon
+    },
+    "time_preferences": {
+        "first_appointment": "09:00",  # Prefer first appointments at 9 AM
+        "last_appointment": "17:00",   # Last appointment at 5 PM
+        "buffer_time": 15,  # 15 minutes buffer between appointments
+        "emergency_slots": ["08:00", "12:00", "17:00"]  # Reserved emergency slots
+    },
+    "treatment_spacing": {
+        "surgical": {"min_days": 7, "max_days": 14},  # Surgery follow-ups
+        "endodontic": {"min_days": 3, "max_days": 10},  # Root canal follow-ups
+        "prosthetic": {"min_days": 14, "max_days": 21},  # Prosthetic work
+        "routine": {"min_days": 7, "max_days": 30}  # Routine treatments
+    },
+    "patient_considerations": {
+        "elderly": "morning",  # Elderly patients prefer morning
+        "children": "afternoon",  # Children after school
+        "working_adults": "early_morning_or_evening"
+    }
+})
+
+_TREATMENT_RULES = MappingProxyType({
+    category: MappingProxyType(rules) for category, rules in {
+        "surgical_treatments": {
+            "keywords": ["extraction", "chirurgie", "implant", "greffe", "avulsion", "sinus lift"],
+            "preferred_time": "morning",
+            "duration_buffer": 30,  # Extra 30 minutes for surgical procedures
+            "post_op_required": True,
+            "avoid_friday": True  # Avoid Friday surgeries for weekend recovery
+        },
+        "endodontic_treatments": {
+            "keywords": ["endodontie", "dévitalisation", "traitement endodontique", "pulpotomie"],
+            "preferred_time": "morning",
+            "duration_buffer": 15,
+            "multiple_sessions": True,
+            "session_spacing": "3-7 days"
+        },
+        "prosthetic_treatments": {
+            "keywords": ["couronne", "bridge", "prothèse", "facette", "onlay", "inlay"],
+            "preferred_time": "morning",
+            "duration_buffer": 15,
+            "multiple_sessions": True,
+            "session_spacing": "14-21 days"
+        },
+        "routine_treatments": {
+            "keywords": ["détartrage", "obturation", "composite", "polissage", "contrôle"],
+            "preferred_time": "afternoon",
+            "duration_buffer": 10,
+            "flexible_scheduling": True
+        },
+        "emergency_treatments": {
+            "keywords": ["urgence", "douleur", "abcès", "trauma", "fracture"],
+            "preferred_time": "any",
+            "priority": "high",
+            "duration_buffer": 20
+        }
+    }.items()
+})
+
 class IntelligentScheduler:
     """AI-powered intelligent scheduling system for dental treatments"""
     
     def __init__(self, client: OpenAI, practice_db: PracticeDatabase):
         self.client = client
         self.practice_db = practice_db
-        self.dentist_preferences = self.get_dentist_preferences()
-        self.treatment_rules = self.get_treatment_scheduling_rules()
+        self.dentist_preferences = _DENTIST_PREFERENCES
+        self.treatment_rules = _TREATMENT_RULES
+        
+        # One compiled keyword matcher per category, checked in rule order
+        self._category_patterns = [
+            (category, re.compile('|'.join(re.escape(keyword.lower()) for keyword in rules["keywords"])))
+            for category, rules in self.treatment_rules.items()
+        ]
+        
+        # Classification results are identical per category, so build them once
+        self._classification_by_cat = {
+            category: {
+                "category": category,
+                "preferred_time": rules["preferred_time"],
+                "duration_buffer": rules.get("duration_buffer", 10),
+                "special_requirements": rules
+            }
+            for category, rules in self.treatment_rules.items()
+        }
+        self._default_classification = {
+            "category": "routine_treatments",
+            "preferred_time": "afternoon",
+            "duration_buffer": 10,
+            "special_requirements": self.treatment_rules["routine_treatments"]
+        }
+        
+        # Memoize per instance so the cache key is only the lowercased name
+        self._classify_cached = functools.lru_cache(maxsize=512)(self._classify_impl)
+        
+        # Per-plan slot memo, only active inside apply_llm_recommendations.
+        # Thread-local because the scheduler instance is shared across requests.
+        self._plan_local = threading.local()
     
     def get_dentist_preferences(self):
         """Get dentist scheduling preferences - can be made configurable later"""
-        return {
-            "working_days": ["monday", "tuesday", "wednesday", "thursday", "friday"],
-            "working_hours": {
-                "start": "08:00",
-                "end": "18:00",
-                "lunch_break": {"start": "12:00", "end": "13:00"}
-            },
-            "preferred_schedules": {
-                "surgeries": "morning",  # Prefer surgeries in the morning
-                "consultations": "afternoon",  # Prefer consultations in the afternoon
-                "long_procedures": "morning",  # Long procedures in the morning when fresh
-                "follow_ups": "afternoon"  # Follow-ups in the afternoon
-            },
-            "time_preferences": {
-                "first_appointment": "09:00",  # Prefer first appointments at 9 AM
-                "last_appointment": "17:00",   # Last appointment at 5 PM
-                "buffer_time": 15,  # 15 minutes buffer between appointments
-                "emergency_slots": ["08:00", "12:00", "17:00"]  # Reserved emergency slots
-            },
-            "treatment_spacing": {
-                "surgical": {"min_days": 7, "max_days": 14},  # Surgery follow-ups
-                "endodontic": {"min_days": 3, "max_days": 10},  # Root canal follow-ups
-                "prosthetic": {"min_days": 14, "max_days": 21},  # Prosthetic work
-                "routine": {"min_days": 7, "max_days": 30}  # Routine treatments
-            },
-            "patient_considerations": {
-                "elderly": "morning",  # Elderly patients prefer morning
-                "children": "afternoon",  # Children after school
-                "working_adults": "early_morning_or_evening"
-            }
-        }
+        return _DENTIST_PREFERENCES
     
     def get_treatment_scheduling_rules(self):
         """Define intelligent rules for different treatment types"""
-        return {
-            "surgical_treatments": {
-                "keywords": ["extraction", "chirurgie", "implant", "greffe", "avulsion", "sinus lift"],
-                "preferred_time": "morning",
-                "duration_buffer": 30,  # Extra 30 minutes for surgical procedures
-                "post_op_required": True,
-                "avoid_friday": True  # Avoid Friday surgeries for weekend recovery
-            },
-            "endodontic_treatments": {
-                "keywords": ["endodontie", "dévitalisation", "traitement endodontique", "pulpotomie"],
-                "preferred_time": "morning",
-                "duration_buffer": 15,
-                "multiple_sessions": True,
-                "session_spacing": "3-7 days"
-            },
-            "prosthetic_treatments": {
-                "keywords": ["couronne", "bridge", "prothèse", "facette", "onlay", "inlay"],
-                "preferred_time": "morning",
-                "duration_buffer": 15,
-                "multiple_sessions": True,
-                "session_spacing": "14-21 days"
-            },
-            "routine_treatments": {
-                "keywords": ["détartrage", "obturation", "composite", "polissage", "contrôle"],
-                "preferred_time": "afternoon",
-                "duration_buffer": 10,
-                "flexible_scheduling": True
-            },
-            "emergency_treatments": {
-                "keywords": ["urgence", "douleur", "abcès", "trauma", "fracture"],
-                "preferred_time": "any",
-                "priority": "high",
-                "duration_buffer": 20
-            }
-        }
+        return _TREATMENT_RULES
     
     def classify_treatment(self, treatment_name: str) -> dict:
         """Classify a treatment and return its scheduling properties"""
-        treatment_lower = treatment_name.lower()
-        
-        for category, rules in self.treatment_rules.items():
-            if any(keyword in treatment_lower for keyword in rules["keywords"]):
-                return {
-                    "category": category,
-                    "preferred_time": rules["preferred_time"],
-                    "duration_buffer": rules.get("duration_buffer", 10),
-                    "special_requirements": rules
-                }
+        return self._classify_cached(treatment_name.lower())
+    
+    def _classify_impl(self, treatment_lower: str) -> dict:
+        """Keyword scan behind classify_treatment (expects a lowercased name)"""
+        for category, pattern in self._category_patterns:
+            if pattern.search(treatment_lower):
+                return self._classification_by_cat[category]
         
         # Default classification
-        return {
-            "category": "routine_treatments",
-            "preferred_time": "afternoon",
-            "duration_buffer": 10,
-            "special_requirements": self.treatment_rules["routine_treatments"]
-        }
+        return self._default_classification
     
     def get_patient_preferences(self, patient_id: str) -> dict:
         """Get patient-specific scheduling preferences"""
@@ -4008,26 +4017,24 @@ class IntelligentScheduler:
         
         # Calculate age if birth_date is available
         age = None
-        if patient.get('birth_date'):
-            try:
-                birth_date = datetime.strptime(patient['birth_date'], '%Y-%m-%d')
-                age = (datetime.now() - birth_date).days // 365
-            except:
-                pass
+        birth_date = patient.get('birth_date')
+        if not isinstance(birth_date, str):
+            # PostgreSQL returns DATE columns as date objects
+            birth_date = birth_date.isoformat() if hasattr(birth_date, 'isoformat') else ''
+        m = _BIRTH_DATE_RE.match(birth_date)
+        if m:
+            today = datetime.now()
+            birth = tuple(map(int, m.groups()))
+            age = today.year - birth[0] - ((today.month, today.day) < birth[1:])
         
         preferences = {}
         
         # Age-based preferences
         if age:
-            if age >= 65:
-                preferences["preferred_time"] = "morning"
-                preferences["reason"] = "Elderly patient - morning preferred"
-            elif age <= 18:
-                preferences["preferred_time"] = "afternoon"
-                preferences["reason"] = "Young patient - afternoon preferred"
-            elif 25 <= age <= 55:
-                preferences["preferred_time"] = "early_morning_or_evening"
-                preferences["reason"] = "Working adult - early morning or evening preferred"
+            preferred_time, reason = _AGE_PREFS[bisect.bisect_left(_AGE_BUCKETS, age)]
+            if preferred_time:
+                preferences["preferred_time"] = preferred_time
+                preferences["reason"] = reason
         
         return preferences
     
@@ -4045,19 +4052,22 @@ class IntelligentScheduler:
             "recommendations": []
         }
         
+        classify = self.classify_treatment
+        morning_load = surgical_count = 0
+        
         for apt in appointments:
-            hour = int(apt['appointment_time'].split(':')[0])
-            if hour < 12:
-                analysis["morning_load"] += 1
-            else:
-                analysis["afternoon_load"] += 1
+            # Times are stored zero-padded (HH:MM)
+            if int(apt['appointment_time'][:2]) < 12:
+                morning_load += 1
             
             # Classify existing appointments
-            treatment_class = self.classify_treatment(apt.get('treatment_type', ''))
-            if treatment_class["category"] in ["surgical_treatments", "endodontic_treatments"]:
-                analysis["surgical_count"] += 1
-            else:
-                analysis["routine_count"] += 1
+            if classify(apt.get('treatment_type', ''))["category"] in _SURGICAL_CATS:
+                surgical_count += 1
+        
+        analysis["morning_load"] = morning_load
+        analysis["afternoon_load"] = len(appointments) - morning_load
+        analysis["surgical_count"] = surgical_count
+        analysis["routine_count"] = len(appointments) - surgical_count
         
         # Get available slots
         analysis["available_slots"] = self.practice_db.get_available_slots(date, 60)
@@ -4074,31 +4084,42 @@ class IntelligentScheduler:
         """Generate an intelligent schedule using LLM analysis"""
         
         try:
-            print(f"🔍 DEBUG: Starting intelligent schedule generation")
-            print(f"🔍 DEBUG: patient_id = {patient_id} (type: {type(patient_id)})")
-            print(f"🔍 DEBUG: treatment_sequence = {treatment_sequence} (type: {type(treatment_sequence)})")
-            print(f"🔍 DEBUG: start_date = {start_date} (type: {type(start_date)})")
+            if _DEBUG:
+                _log.debug("Starting intelligent schedule generation")
+                _log.debug("patient_id = %s (type: %s)", patient_id, type(patient_id))
+                _log.debug("treatment_sequence = %s (type: %s)", treatment_sequence, type(treatment_sequence))
+                _log.debug("start_date = %s (type: %s)", start_date, type(start_date))
             
             # Get patient preferences
             patient_prefs = self.get_patient_preferences(patient_id)
-            print(f"🔍 DEBUG: patient_prefs = {patient_prefs} (type: {type(patient_prefs)})")
+            if _DEBUG:
+                _log.debug("patient_prefs = %s (type: %s)", patient_prefs, type(patient_prefs))
             
             patient = self.practice_db.get_patient(patient_id)
-            print(f"🔍 DEBUG: patient = {patient} (type: {type(patient)})")
+            if _DEBUG:
+                _log.debug("patient = %s (type: %s)", patient, type(patient))
             
             # Analyze treatments
             treatment_analysis = []
+            classifications = []
             for i, treatment in enumerate(treatment_sequence):
-                print(f"🔍 DEBUG: Processing treatment {i}: {treatment} (type: {type(treatment)})")
+                if _DEBUG:
+                    _log.debug("Processing treatment %s: %s (type: %s)", i, treatment, type(treatment))
                 
                 classification = self.classify_treatment(treatment.get('traitement', ''))
-                print(f"🔍 DEBUG: classification = {classification} (type: {type(classification)})")
+                if _DEBUG:
+                    _log.debug("classification = %s (type: %s)", classification, type(classification))
                 
+                classifications.append(classification)
                 treatment_analysis.append({
                     "step": i + 1,
                     "treatment": treatment.get('traitement', ''),
                     "duration": treatment.get('duree', '60 min'),
-                    "classification": classification,
+                    # Only what the LLM needs; the rules are already in the system prompt
+                    "classification": {
+                        "category": classification["category"],
+                        "preferred_time": classification["preferred_time"]
+                    },
                     "original_delay": treatment.get('delai', '1 semaine')
                 })
             
@@ -4109,33 +4130,39 @@ class IntelligentScheduler:
                     "age": patient_prefs.get("age"),
                     "preferences": patient_prefs
                 },
-                "dentist_preferences": self.dentist_preferences,
+                # Only the fields the LLM prompt reads
+                "dentist_preferences": {
+                    "working_days": self.dentist_preferences["working_days"],
+                    "working_hours": self.dentist_preferences["working_hours"],
+                    "preferred_schedules": self.dentist_preferences["preferred_schedules"]
+                },
                 "treatment_analysis": treatment_analysis,
                 "start_date": start_date
             }
             
-            print(f"🔍 DEBUG: LLM context prepared")
+            if _DEBUG:
+                _log.debug("LLM context prepared")
             
             # Generate intelligent scheduling with LLM
             llm_response = self.get_llm_scheduling_recommendations(context)
-            print(f"🔍 DEBUG: LLM response = {llm_response} (type: {type(llm_response)})")
+            if _DEBUG:
+                _log.debug("LLM response = %s (type: %s)", llm_response, type(llm_response))
             
             # Apply LLM recommendations to create optimized schedule
             optimized_schedule = self.apply_llm_recommendations(
                 treatment_sequence, 
                 llm_response, 
                 start_date, 
-                patient_id
+                patient_id,
+                classifications=classifications
             )
             
-            print(f"🔍 DEBUG: Optimized schedule generated successfully")
+            if _DEBUG:
+                _log.debug("Optimized schedule generated successfully")
             return optimized_schedule
             
         except Exception as e:
-            print(f"❌ ERROR in generate_intelligent_schedule: {str(e)}")
-            print(f"❌ ERROR type: {type(e)}")
-            import traceback
-            traceback.print_exc()
+            _log.exception("Error in generate_intelligent_schedule: %s", e)
             raise e
     
     def get_llm_scheduling_recommendations(self, context: dict) -> dict:
@@ -4169,7 +4196,7 @@ class IntelligentScheduler:
         Préférences patient: {context['patient_info']['preferences']}
         
         Traitements à planifier:
-        {json.dumps(context['treatment_analysis'], indent=2, ensure_ascii=False)}
+        {json.dumps(context['treatment_analysis'], separators=(',', ':'), ensure_ascii=False)}
         
         Date de début souhaitée: {context['start_date']}
         
@@ -4197,15 +4224,11 @@ class IntelligentScheduler:
             content = response.choices[0].message.content
             
             # Extract JSON from response if it's wrapped in markdown
-            if "```json" in content:
-                json_start = content.find("```json") + 7
-                json_end = content.find("```", json_start)
-                json_content = content[json_start:json_end].strip()
-            else:
-                json_content = content
+            match = _JSON_FENCE.search(content)
+            json_content = match.group(1) if match else content.strip()
             
             try:
-                llm_recommendations = json.loads(json_content)
+                llm_recommendations = _normalize_llm_response(json.loads(json_content))
             except json.JSONDecodeError:
                 # Fallback to basic parsing if JSON parsing fails
                 llm_recommendations = {
@@ -4218,7 +4241,7 @@ class IntelligentScheduler:
             return llm_recommendations
             
         except Exception as e:
-            print(f"❌ LLM scheduling error: {e}")
+            _log.error("LLM scheduling error: %s", e)
             return {
                 "timing_recommendations": [],
                 "spacing_adjustments": [],
@@ -4227,64 +4250,69 @@ class IntelligentScheduler:
             }
     
     def apply_llm_recommendations(self, treatment_sequence: list, llm_response: dict, 
-                                start_date: str, patient_id: str) -> dict:
+                                start_date: str, patient_id: str, classifications: list = None) -> dict:
         """Apply LLM recommendations to create optimized schedule"""
         
         try:
-            print(f"🔍 DEBUG: Starting apply_llm_recommendations")
-            print(f"🔍 DEBUG: treatment_sequence = {len(treatment_sequence)} treatments")
-            print(f"🔍 DEBUG: llm_response keys = {list(llm_response.keys())}")
-            print(f"🔍 DEBUG: start_date = {start_date}")
-            print(f"🔍 DEBUG: patient_id = {patient_id}")
+            # Prefetch bookings for this plan only; they may change between plans
+            self._prefetch_plan_slots(treatment_sequence, start_date)
+            
+            if _DEBUG:
+                _log.debug("Starting apply_llm_recommendations")
+                _log.debug("treatment_sequence = %s treatments", len(treatment_sequence))
+                _log.debug("llm_response keys = %s", list(llm_response.keys()))
+                _log.debug("start_date = %s", start_date)
+                _log.debug("patient_id = %s", patient_id)
             
             optimized_appointments = []
-            current_date = datetime.strptime(start_date, '%Y-%m-%d')
+            current_date = datetime.fromisoformat(start_date)
+            
+            # Index LLM recommendations by step once instead of scanning per step
+            timing_by_step = self._index_by_step(llm_response.get('timing_recommendations'))
+            spacing_by_step = self._index_by_step(llm_response.get('spacing_adjustments'))
             
+            # Resolve each step's classification, timing and duration up front
+            steps = []
             for i, treatment in enumerate(treatment_sequence):
-                print(f"🔍 DEBUG: Processing treatment {i}: {treatment}")
+                if _DEBUG:
+                    _log.debug("Processing treatment %s: %s", i, treatment)
                 
-                treatment_class = self.classify_treatment(treatment.get('traitement', ''))
-                print(f"🔍 DEBUG: treatment_class = {treatment_class} (type: {type(treatment_class)})")
+                # Reuse the classification computed during treatment analysis
+                if classifications is not None:
+                    treatment_class = classifications[i]
+                else:
+                    treatment_class = self.classify_treatment(treatment.get('traitement', ''))
+                if not isinstance(treatment_class, dict):
+                    treatment_class = _DEFAULT_CLASSIFICATION
                 
                 # Apply LLM timing recommendations if available
                 preferred_time = self.get_optimal_time_for_treatment(
-                    treatment, treatment_class, llm_response, i
-                )
-                print(f"🔍 DEBUG: preferred_time = {preferred_time}")
-                
-                # Apply intelligent date scheduling
-                appointment_date = self.get_optimal_date_for_treatment(
-                    current_date, treatment, treatment_class, llm_response, i
+                    treatment, treatment_class, timing_by_step, i
                 )
-                print(f"🔍 DEBUG: appointment_date = {appointment_date}")
-                
-                # Get available slots for the optimal date
                 duration_minutes = self.parse_duration_minutes(treatment.get('duree', '60 min'))
-                print(f"🔍 DEBUG: duration_minutes = {duration_minutes}")
-                
-                available_slots = self.practice_db.get_available_slots(
-                    appointment_date.strftime('%Y-%m-%d'), 
-                    duration_minutes
-                )
-                print(f"🔍 DEBUG: available_slots = {available_slots}")
+                if _DEBUG:
+                    _log.debug("treatment_class = %s, preferred_time = %s, duration_minutes = %s",
+                               treatment_class, preferred_time, duration_minutes)
                 
-                # Find best time slot
-                final_time = self.find_best_time_slot(
-                    available_slots, preferred_time, treatment_class
-                )
-                print(f"🔍 DEBUG: final_time = {final_time}")
+                steps.append({
+                    'treatment': treatment,
+                    'classification': treatment_class,
+                    'preferred_time': preferred_time,
+                    'duration_minutes': duration_minutes,
+                    'spacing_days': self._spacing_days(treatment, treatment_class, spacing_by_step, i)
+                })
+            
+            for i, step in enumerate(steps):
+                treatment = step['treatment']
+                treatment_class = step['classification']
+                duration_minutes = step['duration_minutes']
                 
-                # If no slots available, try next working day
-                if not final_time:
-                    print(f"🔍 DEBUG: No slots available, finding next available slot")
-                    appointment_date, final_time = self.find_next_available_slot(
-                        appointment_date, duration_minutes, treatment_class
-                    )
-                    print(f"🔍 DEBUG: Next available: {appointment_date}, {final_time}")
+                appointment_date, final_time = self._place_step_greedy(current_date, step)
                 
                 # Get scheduling reasoning
                 reasoning = self.get_scheduling_reasoning(treatment, treatment_class, llm_response, i)
-                print(f"🔍 DEBUG: reasoning = {reasoning}")
+                if _DEBUG:
+                    _log.debug("reasoning = %s", reasoning)
                 
                 optimized_appointments.append({
                     'date': appointment_date,
@@ -4299,9 +4327,11 @@ class IntelligentScheduler:
                 current_date = self.calculate_next_appointment_date(
                     appointment_date, treatment, treatment_class, llm_response
                 )
-                print(f"🔍 DEBUG: Next current_date = {current_date}")
+                if _DEBUG:
+                    _log.debug("Next current_date = %s", current_date)
             
-            print(f"🔍 DEBUG: Generating scheduling summary")
+            if _DEBUG:
+                _log.debug("Generating scheduling summary")
             scheduling_summary = self.generate_scheduling_summary(optimized_appointments, llm_response)
             
             result = {
@@ -4311,72 +4341,87 @@ class IntelligentScheduler:
                 'scheduling_summary': scheduling_summary
             }
             
-            print(f"🔍 DEBUG: apply_llm_recommendations completed successfully")
+            if _DEBUG:
+                _log.debug("apply_llm_recommendations completed successfully")
             return result
             
         except Exception as e:
-            print(f"❌ ERROR in apply_llm_recommendations: {str(e)}")
-            print(f"❌ ERROR type: {type(e)}")
-            import traceback
-            traceback.print_exc()
+            _log.exception("Error in apply_llm_recommendations: %s", e)
             raise e
+        
+        finally:
+            self._plan_local.slot_memo = None
+            self._plan_local.booked_by_date = None
+    
+    def _place_step_greedy(self, current_date: datetime, step: dict) -> tuple:
+        """Pick a date and time for one step, starting from the base date"""
+        treatment_class = step['classification']
+        
+        # Apply intelligent date scheduling
+        appointment_date = self.adjust_to_working_day(
+            current_date + timedelta(days=step['spacing_days']), treatment_class
+        )
+        
+        # Get available slots for the optimal date
+        available_slots = self.get_available_slots(
+            appointment_date.date().isoformat(), 
+            step['duration_minutes']
+        )
+        if _DEBUG:
+            _log.debug("appointment_date = %s, available_slots = %s", appointment_date, available_slots)
+        
+        # Find best time slot
+        final_time = self.find_best_time_slot(
+            available_slots, step['preferred_time'], treatment_class
+        )
+        
+        # If no slots available, try next working day
+        if not final_time:
+            if _DEBUG:
+                _log.debug("No slots available, finding next available slot")
+            appointment_date, final_time = self.find_next_available_slot(
+                appointment_date, step['duration_minutes'], treatment_class
+            )
+        
+        if _DEBUG:
+            _log.debug("Placed at %s, %s", appointment_date, final_time)
+        return appointment_date, final_time
+    
+    def _index_by_step(self, recommendations) -> dict:
+        """Map LLM recommendation entries by their 'step' (first entry wins)"""
+        by_step = {}
+        for rec in recommendations or []:
+            # Type check - skip if rec is not a dict
+            if not isinstance(rec, dict):
+                if _DEBUG:
+                    _log.debug("LLM recommendation is not a dict, got %s: %s", type(rec), rec)
+                continue
+            # Steps are looked up by number; other JSON values (lists, dicts) could not be keys
+            step = rec.get('step')
+            if isinstance(step, (int, float)):
+                by_step.setdefault(step, rec)
+        return by_step
     
     def get_optimal_time_for_treatment(self, treatment: dict, classification: dict, 
-                                     llm_response: dict, step_index: int) -> str:
+                                     timing_by_step: dict, step_index: int) -> str:
         """Determine optimal time for a specific treatment"""
         
-        # Type check and fix classification if it's not a dict
-        if not isinstance(classification, dict):
-            print(f"⚠️  Warning: classification is not a dict, got {type(classification)}: {classification}")
-            return '09:00'  # Default time
-        
         # Check LLM recommendations first
-        if llm_response.get('timing_recommendations'):
-            for rec in llm_response['timing_recommendations']:
-                # Type check - skip if rec is not a dict
-                if not isinstance(rec, dict):
-                    print(f"⚠️  Warning: timing_recommendation is not a dict, got {type(rec)}: {rec}")
-                    continue
-                if rec.get('step') == step_index + 1:
-                    return rec.get('recommended_time', '09:00')
+        rec = timing_by_step.get(step_index + 1)
+        if rec is not None:
+            return rec.get('recommended_time', '09:00')
         
         # Use classification-based logic
-        preferred_time = classification.get('preferred_time', 'morning')
-        
-        if preferred_time == 'morning':
-            return '09:00'
-        elif preferred_time == 'afternoon':
-            return '14:00'
-        else:
-            return '09:00'  # Default
+        return self.get_preferred_time_for_classification(classification)
     
-    def get_optimal_date_for_treatment(self, current_date: datetime, treatment: dict, 
-                                     classification: dict, llm_response: dict, step_index: int) -> datetime:
-        """Determine optimal date for a specific treatment"""
-        
-        # Type check and fix classification if it's not a dict
-        if not isinstance(classification, dict):
-            print(f"⚠️  Warning: classification is not a dict, got {type(classification)}: {classification}")
-            # Return default 7 days later with working day adjustment
-            target_date = current_date + timedelta(days=7)
-            return self.adjust_to_working_day(target_date, {
-                "category": "routine_treatments",
-                "preferred_time": "afternoon",
-                "duration_buffer": 10,
-                "special_requirements": {}
-            })
+    def _spacing_days(self, treatment: dict, classification: dict, 
+                      spacing_by_step: dict, step_index: int) -> int:
+        """Days between the base date and a treatment's target date"""
         
         # Apply LLM spacing adjustments if available
-        if llm_response.get('spacing_adjustments'):
-            for adj in llm_response['spacing_adjustments']:
-                # Type check - skip if adj is not a dict
-                if not isinstance(adj, dict):
-                    print(f"⚠️  Warning: spacing_adjustment is not a dict, got {type(adj)}: {adj}")
-                    continue
-                if adj.get('step') == step_index + 1:
-                    recommended_days = adj.get('recommended_days', 7)
-                    target_date = current_date + timedelta(days=recommended_days)
-                    return self.adjust_to_working_day(target_date, classification)
+        adj = spacing_by_step.get(step_index + 1)
+        if adj is not None:
+            return adj.get('recommended_days', 7)
         
         # Use default spacing logic
         delay_str = treatment.get('delai', '1 semaine')
@@ -4388,37 +4433,19 @@ class IntelligentScheduler:
         elif classification.get('category') == 'endodontic_treatments':
             delay_days = max(delay_days, 3)  # Minimum 3 days for endodontic
         
-        target_date = current_date + timedelta(days=delay_days)
-        return self.adjust_to_working_day(target_date, classification)
+        return delay_days
     
     def adjust_to_working_day(self, date: datetime, classification: dict) -> datetime:
         """Adjust date to working day considering treatment-specific rules"""
         
-        # Skip weekends
-        while date.weekday() >= 5:  # Saturday = 5, Sunday = 6
-            date += timedelta(days=1)
-        
-        # Type check and fix classification if it's not a dict
-        if not isinstance(classification, dict):
-            print(f"⚠️  Warning: classification is not a dict, got {type(classification)}: {classification}")
-            # Create a default classification dict
-            classification = {
-                "category": "routine_treatments",
-                "preferred_time": "afternoon",
-                "duration_buffer": 10,
-                "special_requirements": {}
-            }
-        
-        # Special rule: avoid Friday for surgical treatments
-        try:
-            if (classification.get('category') == 'surgical_treatments' and 
-                classification.get('special_requirements', {}).get('avoid_friday', False)):
-                if date.weekday() == 4:  # Friday
-                    date += timedelta(days=3)  # Move to Monday
-        except Exception as e:
-            print(f"⚠️  Warning in adjust_to_working_day: {e}")
+        # Skip weekends, and Friday too for surgical treatments (weekend recovery)
+        if (classification.get('category') == 'surgical_treatments' and 
+            classification.get('special_requirements', {}).get('avoid_friday', False)):
+            offset = _AVOID_FRI_SURG[date.weekday()]
+        else:
+            offset = _SKIP_WEEKEND[date.weekday()]
         
-        return date
+        return date + timedelta(days=offset) if offset else date
     
     def find_best_time_slot(self, available_slots: list, preferred_time: str, 
                            classification: dict) -> str:
@@ -4427,24 +4454,13 @@ class IntelligentScheduler:
         if not available_slots:
             return None
         
-        # Type check and fix classification if it's not a dict
-        if not isinstance(classification, dict):
-            print(f"⚠️  Warning: classification is not a dict, got {type(classification)}: {classification}")
-            # Just return the first available slot or preferred time if available
-            if preferred_time in available_slots:
-                return preferred_time
-            else:
-                return available_slots[0]
-        
-        # If preferred time is available, use it
-        if preferred_time in available_slots:
-            return preferred_time
-        
-        # Find closest available slot to preferred time
+        # Closest available slot to preferred time (slots are always on the grid).
+        # A free preferred time is at distance 0, so it wins without a separate
+        # containment scan.
         preferred_minutes = self.time_to_minutes(preferred_time)
         
         best_slot = min(available_slots, key=lambda slot: 
-            abs(self.time_to_minutes(slot) - preferred_minutes))
+            abs(_TIME_TO_MIN[slot] - preferred_minutes))
         
         return best_slot
     
@@ -4452,100 +4468,104 @@ class IntelligentScheduler:
                                classification: dict) -> tuple:
         """Find next available slot if current date is full"""
         
-        # Type check and fix classification if it's not a dict
-        if not isinstance(classification, dict):
-            print(f"⚠️  Warning: classification is not a dict, got {type(classification)}: {classification}")
-            # Create a default classification dict
-            classification = {
-                "category": "routine_treatments",
-                "preferred_time": "afternoon",
-                "duration_buffer": 10,
-                "special_requirements": {}
-            }
-        
-        max_attempts = 14  # Try up to 2 weeks
-        current_date = start_date
+        # Get preferred time for this treatment type
+        preferred_time = self.get_preferred_time_for_classification(classification)
         
-        for _ in range(max_attempts):
-            current_date += timedelta(days=1)
-            current_date = self.adjust_to_working_day(current_date, classification)
-            
-            available_slots = self.practice_db.get_available_slots(
-                current_date.strftime('%Y-%m-%d'), 
+        # Try up to 14 working days
+        for current_date in self._iter_working_days(start_date + timedelta(days=1), classification):
+            available_slots = self.get_available_slots(
+                current_date.date().isoformat(), 
                 duration_minutes
             )
             
             if available_slots:
-                # Get preferred time for this treatment type
-                preferred_time = self.get_preferred_time_for_classification(classification)
                 best_slot = self.find_best_time_slot(available_slots, preferred_time, classification)
                 return current_date, best_slot
         
         # If no slots found, return original date with default time
         return start_date, '09:00'
     
+    def _iter_working_days(self, start: datetime, classification: dict, limit: int = 14):
+        """Yield the next `limit` schedulable days from `start` (inclusive)"""
+        # Weekends are always skipped; Fridays too for surgery that avoids them
+        skip_friday = (classification.get('category') == 'surgical_treatments' and 
+                       classification.get('special_requirements', {}).get('avoid_friday', False))
+        closed_days = (4, 5, 6) if skip_friday else (5, 6)
+        
+        current_date = start
+        while limit > 0:
+            if current_date.weekday() not in closed_days:
+                yield current_date
+                limit -= 1
+            current_date += timedelta(days=1)
+    
+    def get_available_slots(self, date_str: str, duration_minutes: int) -> list:
+        """Available slots for a date, memoized for the duration of one plan"""
+        slot_memo = getattr(self._plan_local, 'slot_memo', None)
+        if slot_memo is None:
+            return self.practice_db.get_available_slots(date_str, duration_minutes)
+        
+        key = (date_str, duration_minutes)
+        if key not in slot_memo:
+            booked_by_date = self._plan_local.booked_by_date
+            window_start, window_end = self._plan_local.slot_window
+            if window_start <= date_str <= window_end:
+                # Answer from the bookings prefetched for this plan
+                slot_memo[key] = self.practice_db.compute_available_slots(
+                    booked_by_date.get(date_str, []), duration_minutes
+                )
+            else:
+                slot_memo[key] = self.practice_db.get_available_slots(date_str, duration_minutes)
+        return slot_memo[key]
+    
+    def _prefetch_plan_slots(self, treatment_sequence: list, start_date: str):
+        """Load the bookings covering a whole treatment plan in one query"""
+        # Each step moves forward by its delay plus up to ~2 weeks of spacing
+        window_days = sum(
+            self.parse_delay_to_days(treatment.get('delai', '1 semaine')) + 14
+            for treatment in treatment_sequence
+        ) + 30
+        window_start = start_date
+        window_end = (datetime.fromisoformat(start_date) + timedelta(days=window_days)).date().isoformat()
+        
+        self._plan_local.slot_window = (window_start, window_end)
+        self._plan_local.booked_by_date = self.practice_db.get_booked_slots_by_date(window_start, window_end)
+        self._plan_local.slot_memo = {}
+    
     def get_preferred_time_for_classification(self, classification: dict) -> str:
         """Get preferred time based on treatment classification"""
-        # Type check and fix classification if it's not a dict
-        if not isinstance(classification, dict):
-            print(f"⚠️  Warning: classification is not a dict, got {type(classification)}: {classification}")
-            return '09:00'  # Default time
-        
-        preferred = classification.get('preferred_time', 'morning')
-        
-        if preferred == 'morning':
-            return '09:00'
-        elif preferred == 'afternoon':
-            return '14:00'
-        else:
-            return '09:00'
+        return _PREF_TIME_TO_CLOCK.get(classification.get('preferred_time', 'morning'), '09:00')
     
     def parse_duration_minutes(self, duration_str: str) -> int:
         """Parse duration string to minutes"""
-        try:
-            if 'min' in duration_str:
-                return int(duration_str.split('min')[0].strip())
-            elif 'h' in duration_str:
-                hours = float(duration_str.split('h')[0].strip())
-                return int(hours * 60)
-            else:
-                return 60  # Default
-        except:
-            return 60
+        return _parse_duration_minutes(duration_str)
     
     def parse_delay_to_days(self, delay_str: str) -> int:
         """Parse delay string to days"""
-        try:
-            if 'jour' in delay_str:
-                return int(delay_str.split('jour')[0].strip())
-            elif 'semaine' in delay_str:
-                weeks = int(delay_str.split('semaine')[0].strip())
-                return weeks * 7
-            elif 'mois' in delay_str:
-                months = int(delay_str.split('mois')[0].strip())
-                return months * 30
-            else:
-                return 7  # Default 1 week
-        except:
-            return 7
+        return _parse_delay_to_days(delay_str)
     
     def time_to_minutes(self, time_str: str) -> int:
         """Convert time string to minutes since midnight"""
-        try:
-            hours, minutes = map(int, time_str.split(':'))
-            return hours * 60 + minutes
-        except:
+        # LLM replies may hold lists or dicts here, which the lookup cannot hash
+        if not isinstance(time_str, str):
             return 540  # Default to 9:00 AM
+        
+        minutes = _TIME_TO_MIN.get(time_str)
+        if minutes is not None:
+            return minutes
+        
+        hours, sep, minutes = time_str.partition(':')
+        if sep and hours.isdecimal() and minutes.isdecimal():
+            return int(hours) * 60 + int(minutes)
+        return 540  # Default to 9:00 AM
     
     def calculate_next_appointment_date(self, current_date: datetime, treatment: dict, 
                                       classification: dict, llm_response: dict) -> datetime:
         """Calculate the base date for the next appointment"""
-        
-        # Type check and fix classification if it's not a dict
-        if not isinstance(classification, dict):
-            print(f"⚠️  Warning: classification is not a dict, got {type(classification)}: {classification}")
-            # Return default 7 days later
-            return current_date + timedelta(days=7)
+        return current_date + timedelta(days=self._min_days_after(classification))
+    
+    def _min_days_after(self, classification: dict) -> int:
+        """Minimum days before the appointment following this treatment"""
         
         # Get treatment-specific spacing
         spacing_rules = self.dentist_preferences.get('treatment_spacing', {})
@@ -4559,17 +4579,12 @@ class IntelligentScheduler:
         else:
             min_days = spacing_rules.get('routine', {}).get('min_days', 7)
         
-        return current_date + timedelta(days=min_days)
+        return min_days
     
     def get_scheduling_reasoning(self, treatment: dict, classification: dict, 
                                llm_response: dict, step_index: int) -> str:
         """Generate reasoning for scheduling decision"""
         
-        # Type check and fix classification if it's not a dict
-        if not isinstance(classification, dict):
-            print(f"⚠️  Warning: classification is not a dict, got {type(classification)}: {classification}")
-            return "Programmation standard (classification invalide)"
-        
         reasons = []
         
         # Treatment-based reasoning
@@ -4580,52 +4595,40 @@ class IntelligentScheduler:
         elif classification.get('category') == 'prosthetic_treatments':
             reasons.append("Travail prothétique programmé le matin pour précision optimale")
         
-        # LLM reasoning if available
-        if llm_response.get('priority_notes'):
-            for note in llm_response['priority_notes']:
-                # Type check - ensure note is a string
-                if isinstance(note, str) and str(step_index + 1) in note:
-                    reasons.append(f"IA: {note}")
-                elif not isinstance(note, str):
-                    print(f"⚠️  Warning: priority_note is not a string, got {type(note)}: {note}")
+        # LLM reasoning if available (notes are strings, see _normalize_llm_response)
+        needle = str(step_index + 1)
+        reasons.extend(f"IA: {note}" for note in llm_response.get('priority_notes', ()) if needle in note)
         
         return " | ".join(reasons) if reasons else "Programmation standard"
     
     def generate_scheduling_summary(self, appointments: list, llm_response: dict) -> dict:
         """Generate a summary of the scheduling decisions"""
         
+        # Tally time of day and category in one pass
+        morning = surgical = routine = 0
+        for apt in appointments:
+            if apt['time'] < _NOON:
+                morning += 1
+            
+            # Classifications are normalized to dicts in apply_llm_recommendations
+            category = apt['classification'].get('category')
+            if category == 'surgical_treatments':
+                surgical += 1
+            elif category == 'routine_treatments':
+                routine += 1
+        
         summary = {
             'total_appointments': len(appointments),
-            'morning_appointments': sum(1 for apt in appointments if apt['time'] < '12:00'),
-            'afternoon_appointments': sum(1 for apt in appointments if apt['time'] >= '12:00'),
-            'surgical_appointments': 0,
-            'routine_appointments': 0,
+            'morning_appointments': morning,
+            'afternoon_appointments': len(appointments) - morning,
+            'surgical_appointments': surgical,
+            'routine_appointments': routine,
             'ai_recommendations_applied': len(llm_response.get('timing_recommendations', [])),
             'scheduling_rationale': llm_response.get('schedule_rationale', 'Planification intelligente appliquée'),
-            'insights': []
+            # LLM insights, already filtered to strings by _normalize_llm_response
+            'insights': list(llm_response.get('summary_points', ()))
         }
         
-        # Count surgical and routine appointments with error handling
-        for apt in appointments:
-            classification = apt.get('classification', {})
-            if isinstance(classification, dict):
-                if classification.get('category') == 'surgical_treatments':
-                    summary['surgical_appointments'] += 1
-                elif classification.get('category') == 'routine_treatments':
-                    summary['routine_appointments'] += 1
-            else:
-                print(f"⚠️  Warning: classification is not a dict in summary, got {type(classification)}: {classification}")
-                summary['routine_appointments'] += 1  # Default to routine
-        
-        # Add LLM insights if available
-        if llm_response.get('summary_points'):
-            for point in llm_response['summary_points']:
-                # Type check - ensure point is a string
-                if isinstance(point, str):
-                    summary['insights'].append(point)
-                else:
-                    print(f"⚠️  Warning: summary_point is not a string, got {type(point)}: {point}")
-        
         return summary
 
 # Initialize the intelligent scheduler
@@ -4637,103 +4640,103 @@ def get_current_schedule_context():
         # Get current week appointments
         today = datetime.now()
         week_start = today - timedelta(days=today.weekday())
-        week_end = week_start + timedelta(days=6)
-        
-        appointments = practice_db.get_appointments_by_date_range(
-            week_start.strftime('%Y-%m-%d'),
-            week_end.strftime('%Y-%m-%d')
-        )
+        return _build_week_context(week_start.strftime('%Y-%m-%d'), practice_db.schedule_version)
         
-        # Get practice preferences
-        dentist_prefs = intelligent_scheduler.get_dentist_preferences()
-        
-        # Build context
-        context = f"""
+    except Exception as e:
+        _log.error("Error getting schedule context: %s", e)
+        return "Erreur lors du chargement du contexte planning"
+
+@functools.lru_cache(maxsize=512)
+def _format_day(date_str):
+    """'YYYY-MM-DD' -> 'Weekday DD/MM' heading, memoized per date"""
+    return datetime.strptime(date_str, '%Y-%m-%d').strftime('%A %d/%m')
+
+@functools.lru_cache(maxsize=8)
+def _build_week_context(week_start_str, schedule_version):
+    """Build the weekly schedule context; schedule_version keys out stale entries"""
+    week_start = datetime.strptime(week_start_str, '%Y-%m-%d')
+    week_end = week_start + timedelta(days=6)
+    
+    appointments = practice_db.get_appointments_by_date_range(
+        week_start_str,
+        week_end.strftime('%Y-%m-%d')
+    )
+    
+    # Get practice preferences
+    dentist_prefs = intelligent_scheduler.get_dentist_preferences()
+    
+    # Resolve every patient of the week in one query
+    patients = {
+        p['id']: p
+        for p in practice_db.get_patients_by_ids(list({apt['patient_id'] for apt in appointments}))
+    }
+    
+    # Build context
+    parts = [f"""
 SEMAINE ACTUELLE: {week_start.strftime('%d/%m/%Y')} - {week_end.strftime('%d/%m/%Y')}
 
 RENDEZ-VOUS PROGRAMMÉS:
-"""
-        
-        # Group appointments by day
-        days_appointments = {}
-        for apt in appointments:
-            apt_date = apt['date']
-            if apt_date not in days_appointments:
-                days_appointments[apt_date] = []
-            days_appointments[apt_date].append(apt)
-        
-        # Add appointments to context
-        for date in sorted(days_appointments.keys()):
-            day_name = datetime.strptime(date, '%Y-%m-%d').strftime('%A %d/%m')
-            context += f"\n{day_name}:\n"
-            
-            for apt in sorted(days_appointments[date], key=lambda x: x['time']):
-                patient = practice_db.get_patient(apt['patient_id'])
-                patient_name = f"{patient.get('first_name', '')} {patient.get('last_name', '')}" if patient else "Patient inconnu"
-                context += f"  - {apt['time']}: {patient_name} - {apt['treatment']} ({apt['duration']})\n"
-        
-        # Add available slots information
-        context += f"\n\nPRÉFÉRENCES PRATICIEN:\n"
-        context += f"- Jours de travail: {', '.join(dentist_prefs['working_days'])}\n"
-        context += f"- Horaires: {dentist_prefs['working_hours']['start']} - {dentist_prefs['working_hours']['end']}\n"
-        context += f"- Pause déjeuner: {dentist_prefs['working_hours']['lunch_break']['start']} - {dentist_prefs['working_hours']['lunch_break']['end']}\n"
-        
-        return context
-        
-    except Exception as e:
-        print(f"Error getting schedule context: {e}")
-        return "Erreur lors du chargement du contexte planning"
+"""]
+    
+    # Group appointments by day
+    days_appointments = defaultdict(list)
+    for apt in appointments:
+        days_appointments[apt['date']].append(apt)
+    
+    # Add appointments to context
+    for date in sorted(days_appointments):
+        day_name = _format_day(date)
+        parts.append(f"\n{day_name}:\n")
+        
+        for apt in sorted(days_appointments[date], key=itemgetter('time')):
+            patient = patients.get(apt['patient_id'])
+            patient_name = f"{patient.get('first_name', '')} {patient.get('last_name', '')}" if patient else "Patient inconnu"
+            parts.append(f"  - {apt['time']}: {patient_name} - {apt['treatment']} ({apt['duration']})\n")
+    
+    # Add available slots information
+    working_hours = dentist_prefs['working_hours']
+    parts.append(f"\n\nPRÉFÉRENCES PRATICIEN:\n")
+    parts.append(f"- Jours de travail: {', '.join(dentist_prefs['working_days'])}\n")
+    parts.append(f"- Horaires: {working_hours['start']} - {working_hours['end']}\n")
+    parts.append(f"- Pause déjeuner: {working_hours['lunch_break']['start']} - {working_hours['lunch_break']['end']}\n")
+    
+    return "".join(parts)
+
+# Keywords hinting at each schedule action, matched as substrings in one pass
+_ACTION_RE = re.compile(
+    r'(?P<reschedule>reprogrammer|déplacer|changer|modifier)'
+    r'|(?P<find_slot>trouver|créer|libérer|créneau)'
+    r'|(?P<optimize>optimiser|améliorer|organiser)'
+    r'|(?P<emergency>urgence|urgent|immédiat)'
+)
+_ACTION_META = {
+    'reschedule': ('Reprogrammation de rendez-vous détectée', 'high'),
+    'find_slot': ('Recherche de créneau détectée', 'medium'),
+    'optimize': ('Optimisation du planning détectée', 'low'),
+    'emergency': ('Gestion d\'urgence détectée', 'urgent'),
+}
 
 def parse_schedule_actions(llm_response):
     """Parse LLM response for actionable schedule items"""
     try:
-        actions = []
-        
         # Look for common action patterns
-        response_lower = llm_response.lower()
-        
-        # Reschedule patterns
-        if any(word in response_lower for word in ['reprogrammer', 'déplacer', 'changer', 'modifier']):
-            actions.append({
-                'type': 'reschedule',
-                'description': 'Reprogrammation de rendez-vous détectée',
-                'priority': 'high'
-            })
+        seen = {m.lastgroup for m in _ACTION_RE.finditer(llm_response.lower())}
         
-        # Find slot patterns
-        if any(word in response_lower for word in ['trouver', 'créer', 'libérer', 'créneau']):
-            actions.append({
-                'type': 'find_slot',
-                'description': 'Recherche de créneau détectée',
-                'priority': 'medium'
-            })
-        
-        # Optimize patterns
-        if any(word in response_lower for word in ['optimiser', 'améliorer', 'organiser']):
-            actions.append({
-                'type': 'optimize',
-                'description': 'Optimisation du planning détectée',
-                'priority': 'low'
-            })
-        
-        # Emergency patterns
-        if any(word in response_lower for word in ['urgence', 'urgent', 'immédiat']):
-            actions.append({
-                'type': 'emergency',
-                'description': 'Gestion d\'urgence détectée',
-                'priority': 'urgent'
-            })
-        
-        return actions
+        return [
+            {'type': action_type, 'description': description, 'priority': priority}
+            for action_type, (description, priority) in _ACTION_META.items()
+            if action_type in seen
+        ]
         
     except Exception as e:
-        print(f"Error parsing schedule actions: {e}")
+        _log.error("Error parsing schedule actions: %s", e)
         return []
 
 def analyze_schedule_request(user_message, schedule_context):
     """Analyze user request and extract specific schedule actions"""
     try:
-        print(f"🔍 Analyzing schedule request: {user_message}")
+        if _DEBUG:
+            _log.debug("Analyzing schedule request: %s", user_message)
         
         # Enhanced analysis prompt with French date detection
         analysis_prompt = f"""
@@ -4789,19 +4792,17 @@ Réponds au format JSON avec:
         )
         
         content = response.choices[0].message.content
-        print(f"🔍 LLM Analysis response: {content}")
+        if _DEBUG:
+            _log.debug("LLM Analysis response: %s", content)
         
         # Extract JSON from response
-        if "```json" in content:
-            json_start = content.find("```json") + 7
-            json_end = content.find("```", json_start)
-            json_content = content[json_start:json_end].strip()
-        else:
-            json_content = content
+        m = _JSON_FENCE.search(content)
+        json_content = m.group(1) if m else content
         
         try:
             analysis = json.loads(json_content)
-            print(f"🔍 Parsed analysis: {analysis}")
+            if _DEBUG:
+                _log.debug("Parsed analysis: %s", analysis)
             
             # Enhance with date detection if not already present
             if not analysis.get('detected_dates'):
@@ -4810,8 +4811,9 @@ Réponds au format JSON avec:
             return analysis
             
         except json.JSONDecodeError as e:
-            print(f"❌ JSON parsing error: {e}")
-            print(f"Raw content: {content}")
+            _log.warning("JSON parsing error: %s", e)
+            if _DEBUG:
+                _log.debug("Raw content: %s", content)
             
             # Fallback analysis
             return {
@@ -4832,7 +4834,7 @@ Réponds au format JSON avec:
             }
             
     except Exception as e:
-        print(f"❌ Error analyzing schedule request: {e}")
+        _log.error("Error analyzing schedule request: %s", e)
         return {
             "analysis": f"Erreur d'analyse: {str(e)}",
             "detected_dates": [],
@@ -4841,91 +4843,81 @@ Réponds au format JSON avec:
             "confirmation_needed": "Une erreur s'est produite lors de l'analyse."
         }
 
+# DD/MM[/YYYY] dates, relative days and weekday names in French requests
+_FR_DATE_RE = re.compile(r'\b(\d{1,2})[\/\-](\d{1,2})(?:[\/\-](\d{4}))?\b')
+_FR_RELATIVE_RE = re.compile(r'\b(après-demain|demain)\b')  # longest first
+_FR_DAY_RE = re.compile(r'\b(lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche)\b')
+_FR_RELATIVE_DAYS = {'demain': 1, 'après-demain': 2}
+_FR_DAYS = {
+    'lundi': 0, 'mardi': 1, 'mercredi': 2, 'jeudi': 3, 
+    'vendredi': 4, 'samedi': 5, 'dimanche': 6
+}
+
 def extract_dates_from_french_text(text):
     """Extract dates from French text"""
-    import re
-    
-    dates = []
+    dates = set()
     text_lower = text.lower()
     
     # Pattern for DD/MM format
-    date_pattern = r'\b(\d{1,2})[\/\-](\d{1,2})(?:[\/\-](\d{4}))?\b'
-    matches = re.findall(date_pattern, text)
-    
-    for match in matches:
-        day, month, year = match
+    for day, month, year in _FR_DATE_RE.findall(text):
         if not year:
             year = datetime.now().year
         
         try:
             date_obj = datetime(int(year), int(month), int(day))
-            dates.append(date_obj.strftime('%Y-%m-%d'))
+            dates.add(date_obj.strftime('%Y-%m-%d'))
         except ValueError:
             continue
     
     # Handle relative dates
     today = datetime.now()
     
-    if 'demain' in text_lower:
-        dates.append((today + timedelta(days=1)).strftime('%Y-%m-%d'))
-    
-    if 'après-demain' in text_lower:
-        dates.append((today + timedelta(days=2)).strftime('%Y-%m-%d'))
+    for relative in set(_FR_RELATIVE_RE.findall(text_lower)):
+        dates.add((today + timedelta(days=_FR_RELATIVE_DAYS[relative])).strftime('%Y-%m-%d'))
     
     # Handle day names (vendredi, lundi, etc.)
-    days_fr = {
-        'lundi': 0, 'mardi': 1, 'mercredi': 2, 'jeudi': 3, 
-        'vendredi': 4, 'samedi': 5, 'dimanche': 6
-    }
+    for day_name in set(_FR_DAY_RE.findall(text_lower)):
+        # Find next occurrence of this day
+        days_ahead = (_FR_DAYS[day_name] - today.weekday()) % 7
+        if days_ahead == 0:  # Today
+            days_ahead = 7  # Next week
+        target_date = today + timedelta(days=days_ahead)
+        dates.add(target_date.strftime('%Y-%m-%d'))
     
-    for day_name, day_num in days_fr.items():
-        if day_name in text_lower:
-            # Find next occurrence of this day
-            days_ahead = (day_num - today.weekday()) % 7
-            if days_ahead == 0:  # Today
-                days_ahead = 7  # Next week
-            target_date = today + timedelta(days=days_ahead)
-            dates.append(target_date.strftime('%Y-%m-%d'))
+    return list(dates)
+
+# YYYY-MM-DD, DD/MM[/YYYY] (or with dashes) and DDMM date inputs
+_DATE_NORM_RE = re.compile(
+    r'^(?:(?P<y1>\d{4})-(?P<m1>\d{1,2})-(?P<d1>\d{1,2})'
+    r'|(?P<d2>\d{1,2})[\/\-](?P<m2>\d{1,2})(?:[\/\-](?P<y2>\d{4}))?'
+    r'|(?P<d3>\d{2})(?P<m3>\d{2}))$'
+)
+
+def _normalize_date_str(date_str):
+    """Normalize a user-supplied date to YYYY-MM-DD (current year by default)"""
+    m = _DATE_NORM_RE.match(date_str.strip())
+    if not m:
+        raise ValueError(f"Cannot parse date: {date_str}")
     
-    return list(set(dates))  # Remove duplicates
+    g = m.groupdict()
+    day = g['d1'] or g['d2'] or g['d3']
+    month = g['m1'] or g['m2'] or g['m3']
+    year = g['y1'] or g['y2'] or datetime.now().year
+    return f"{year}-{int(month):02d}-{int(day):02d}"
 
 def find_appointments_for_date(date_str):
     """Find appointments for a specific date"""
     try:
-        print(f"🔍 Finding appointments for date: {date_str}")
+        if _DEBUG:
+            _log.debug("Finding appointments for date: %s", date_str)
         
         # Parse date string (handle various formats)
-        if '/' in date_str:
-            # Handle DD/MM or DD/MM/YYYY format
-            parts = date_str.split('/')
-            if len(parts) == 2:
-                day, month = parts
-                year = datetime.now().year
-            elif len(parts) == 3:
-                day, month, year = parts
-            else:
-                raise ValueError(f"Invalid date format: {date_str}")
-            
-            # Convert to YYYY-MM-DD format
-            formatted_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-        elif '-' in date_str:
-            # Already in YYYY-MM-DD format
-            formatted_date = date_str
-        else:
-            # Try to parse as DD/MM without separator
-            if len(date_str) == 4:  # DDMM
-                day = date_str[:2]
-                month = date_str[2:]
-                year = datetime.now().year
-                formatted_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            else:
-                raise ValueError(f"Cannot parse date: {date_str}")
-        
-        print(f"🔍 Formatted date: {formatted_date}")
+        formatted_date = _normalize_date_str(date_str)
         
         # Get appointments from database
         appointments = practice_db.get_appointments_for_date(formatted_date)
-        print(f"🔍 Found {len(appointments)} appointments")
+        if _DEBUG:
+            _log.debug("Formatted date: %s, found %s appointments", formatted_date, len(appointments))
         
         # Format appointments for frontend
         formatted_appointments = []
@@ -4945,21 +4937,26 @@ def find_appointments_for_date(date_str):
         return formatted_appointments
         
     except Exception as e:
-        print(f"❌ Error finding appointments for date {date_str}: {e}")
+        _log.error("Error finding appointments for date %s: %s", date_str, e)
         return []
 
 def propose_reschedule_options(appointments, target_date=None):
     """Propose intelligent reschedule options using AI analysis"""
     try:
-        print(f"🧠 AI analyzing reschedule options for {len(appointments)} appointments")
+        if _DEBUG:
+            _log.debug("Analyzing reschedule options for %s appointments", len(appointments))
         
-        if not appointments:
+        # Nothing can be moved without an appointment ID; skip the slot queries
+        if not any(apt.get('id') for apt in appointments):
             return []
         
-        # Get available slots for the next 2 weeks
+        # Load the bookings of the next 2 weeks once
         today = datetime.now()
-        available_slots_by_date = {}
+        booked_by_date = practice_db.get_booked_slots_by_date(
+            today.strftime('%Y-%m-%d'), (today + timedelta(days=13)).strftime('%Y-%m-%d')
+        )
         
+        working_days = []
         for i in range(14):  # Next 2 weeks
             date = today + timedelta(days=i)
             if date.weekday() < 5:  # Monday to Friday only
@@ -4972,14 +4969,27 @@ def propose_reschedule_options(appointments, target_date=None):
                     'Thursday': 'Jeudi',
                     'Friday': 'Vendredi'
                 }.get(day_name, day_name)
-                
-                slots = practice_db.get_available_slots(date_str, 60)
-                if slots:
-                    available_slots_by_date[date_str] = {
-                        'date': date_str,
-                        'day_name': f"{french_day_name} {date.strftime('%d/%m')}",
-                        'slots': slots[:6]  # Limit to 6 slots per day
-                    }
+                working_days.append((date_str, f"{french_day_name} {date.strftime('%d/%m')}"))
+        
+        # Only offer slots that fit each appointment's duration; appointments of
+        # the same duration share one options list
+        options_by_duration = {}
+        
+        def options_for(duration_minutes):
+            if duration_minutes not in options_by_duration:
+                available_options = []
+                for date_str, day_label in working_days:
+                    slots = practice_db.compute_available_slots(
+                        booked_by_date.get(date_str, []), duration_minutes
+                    )
+                    if slots:  # Only include dates with available slots
+                        available_options.append({
+                            'date': date_str,
+                            'day_name': day_label,
+                            'slots': slots[:6]  # Limit to 6 slots per day
+                        })
+                options_by_duration[duration_minutes] = available_options
+            return options_by_duration[duration_minutes]
         
         # Format reschedule options for frontend
         reschedule_options = []
@@ -4997,16 +5007,6 @@ def propose_reschedule_options(appointments, target_date=None):
                 if not patient_name:
                     patient_name = 'Patient inconnu'
             
-            # Convert available slots to the expected format
-            available_options = []
-            for date_str, date_info in available_slots_by_date.items():
-                if date_info['slots']:  # Only include dates with available slots
-                    available_options.append({
-                        'date': date_str,
-                        'day_name': date_info['day_name'],
-                        'slots': date_info['slots']
-                    })
-            
             reschedule_option = {
                 'appointment_id': apt.get('id'),
                 'patient_id': apt.get('patient_id'),
@@ -5015,18 +5015,17 @@ def propose_reschedule_options(appointments, target_date=None):
                 'current_date': apt.get('date'),
                 'current_time': apt.get('time'),
                 'duration_minutes': apt.get('duration_minutes', 60),
-                'available_options': available_options
+                'available_options': options_for(apt.get('duration_minutes') or 60)
             }
             
             reschedule_options.append(reschedule_option)
         
-        print(f"🔍 Generated {len(reschedule_options)} reschedule options")
+        if _DEBUG:
+            _log.debug("Generated %s reschedule options", len(reschedule_options))
         return reschedule_options
         
     except Exception as e:
-        print(f"❌ Error in propose_reschedule_options: {e}")
-        import traceback
-        traceback.print_exc()
+        _log.exception("Error in propose_reschedule_options: %s", e)
         return []
 
         return jsonify({'error': f'Erreur du serveur: {str(e)}'}), 500
@@ -5038,7 +5037,8 @@ def execute_schedule_action():
         data = request.json
         action = data.get('action')
         
-        print(f"🚀 Executing intelligent schedule action: {action}")
+        if _DEBUG:
+            _log.debug("Executing intelligent schedule action: %s", action)
         
         if action == 'reschedule':
             appointments = data.get('appointments', [])
@@ -5051,43 +5051,45 @@ def execute_schedule_action():
             
             # Use intelligent rescheduling
             execution_results = propose_reschedule_options(appointments)
-            
-            # Format response for frontend
-            if execution_results:
-                successful_reschedules = [r for r in execution_results if r.get('success')]
-                failed_reschedules = [r for r in execution_results if not r.get('success')]
-                
-                response_message = "🤖 **Reprogrammation intelligente terminée !**\n\n"
-                
-                if successful_reschedules:
-                    response_message += "✅ **Rendez-vous reprogrammés automatiquement :**\n"
-                    for result in successful_reschedules:
-                        response_message += f"• **{result['patient_name']}** : {result['old_slot']} → **{result['new_slot']}**\n"
-                        response_message += f"  💭 *{result['reasoning']}*\n"
-                        response_message += f"  🎯 *Confiance : {result['confidence']:.1%}*\n\n"
-                
-                if failed_reschedules:
-                    response_message += "⚠️ **Rendez-vous nécessitant attention manuelle :**\n"
-                    for result in failed_reschedules:
-                        response_message += f"• **{result['decision']['patient_name']}** : {result.get('error', 'Erreur inconnue')}\n"
-                
-                response_message += f"\n📊 **Bilan :** {len(successful_reschedules)} reprogrammés automatiquement, {len(failed_reschedules)} nécessitent votre attention."
-                
-                return jsonify({
-                    'success': True,
-                    'message': response_message,
-                    'execution_results': execution_results,
-                    'stats': {
-                        'total': len(execution_results),
-                        'successful': len(successful_reschedules),
-                        'failed': len(failed_reschedules)
-                    }
-                })
-            else:
+            if not execution_results:
                 return jsonify({
                     'success': False,
                     'message': "❌ Aucune reprogrammation automatique n'a pu être effectuée. Veuillez vérifier les créneaux disponibles."
                 })
+            
+            # Format response for frontend: partition and format in one pass
+            success_parts, failure_parts = [], []
+            for result in execution_results:
+                if result.get('success'):
+                    success_parts.append(
+                        f"• **{result['patient_name']}** : {result['old_slot']} → **{result['new_slot']}**\n"
+                        f"  💭 *{result['reasoning']}*\n"
+                        f"  🎯 *Confiance : {result['confidence']:.1%}*\n\n"
+                    )
+                else:
+                    failure_parts.append(f"• **{result['decision']['patient_name']}** : {result.get('error', 'Erreur inconnue')}\n")
+            successful_count, failed_count = len(success_parts), len(failure_parts)
+            
+            parts = ["🤖 **Reprogrammation intelligente terminée !**\n\n"]
+            if success_parts:
+                parts.append("✅ **Rendez-vous reprogrammés automatiquement :**\n")
+                parts.extend(success_parts)
+            if failure_parts:
+                parts.append("⚠️ **Rendez-vous nécessitant attention manuelle :**\n")
+                parts.extend(failure_parts)
+            parts.append(f"\n📊 **Bilan :** {successful_count} reprogrammés automatiquement, {failed_count} nécessitent votre attention.")
+            response_message = "".join(parts)
+            
+            return jsonify({
+                'success': True,
+                'message': response_message,
+                'execution_results': execution_results,
+                'stats': {
+                    'total': len(execution_results),
+                    'successful': successful_count,
+                    'failed': failed_count
+                }
+            })
         
         elif action == 'block_time':
             date = data.get('date')
@@ -5134,9 +5136,7 @@ def execute_schedule_action():
             })
             
     except Exception as e:
-        print(f"❌ Error executing schedule action: {e}")
-        import traceback
-        traceback.print_exc()
+        _log.exception("Error executing schedule action: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -5194,18 +5194,13 @@ def create_emergency_slot(date, time, patient_info):
 
 def calculate_duration(start_time, end_time):
     """Calculate duration between two times in minutes"""
-    try:
-        from datetime import datetime
-        
-        start = datetime.strptime(start_time, '%H:%M')
-        end = datetime.strptime(end_time, '%H:%M')
-        
-        duration = (end - start).total_seconds() / 60
-        return int(duration)
-        
-    except Exception as e:
-        print(f"❌ Error calculating duration: {e}")
+    start_hours, _, start_minutes = str(start_time).partition(':')
+    end_hours, _, end_minutes = str(end_time).partition(':')
+    if not all(part.isdecimal() for part in (start_hours, start_minutes, end_hours, end_minutes)):
+        _log.warning("Error calculating duration: invalid times %r - %r", start_time, end_time)
         return 60  # Default to 1 hour
+    
+    return (int(end_hours) - int(start_hours)) * 60 + int(end_minutes) - int(start_minutes)
 
 @app.route('/api/execute-autonomous-plan', methods=['POST'])
 def execute_autonomous_plan():
@@ -5224,9 +5219,10 @@ def execute_autonomous_plan():
         if not decisions:
             return jsonify({'error': 'Aucune décision à exécuter'}), 400
         
-        print(f"🚀 Executing autonomous plan with {len(decisions)} decisions...")
+        _log.info("Executing autonomous plan with %s decisions", len(decisions))
         
-        # Execute each decision
+        # Execute the executable decisions; all updates commit together in one transaction
+        batch_results = iter(execute_reschedule_batch([d for d in decisions if d.get('success', False)]))
         execution_results = []
         successful_executions = 0
         failed_executions = 0
@@ -5241,23 +5237,12 @@ def execute_autonomous_plan():
                 failed_executions += 1
                 continue
             
-            # Execute the rescheduling
-            try:
-                result = execute_single_reschedule(decision)
-                execution_results.append(result)
-                
-                if result.get('success', False):
-                    successful_executions += 1
-                else:
-                    failed_executions += 1
-                    
-            except Exception as e:
-                print(f"❌ Error executing decision for appointment {decision.get('appointment_id')}: {e}")
-                execution_results.append({
-                    'appointment_id': decision.get('appointment_id'),
-                    'success': False,
-                    'message': f"Erreur lors de l'exécution: {str(e)}"
-                })
+            result = next(batch_results)
+            execution_results.append(result)
+            
+            if result.get('success', False):
+                successful_executions += 1
+            else:
                 failed_executions += 1
         
         # Generate summary
@@ -5283,13 +5268,11 @@ def execute_autonomous_plan():
             'execution_results': execution_results
         }
         
-        print(f"✅ Autonomous plan execution completed: {successful_executions}/{len(decisions)} successful")
+        _log.info("Autonomous plan execution completed: %s/%s successful", successful_executions, len(decisions))
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"❌ Error executing autonomous plan: {e}")
-        import traceback
-        traceback.print_exc()
+        _log.exception("Error executing autonomous plan: %s", e)
         return jsonify({
             'success': False,
             'error': f'Erreur lors de l\'exécution du plan: {str(e)}',
@@ -5297,87 +5280,114 @@ def execute_autonomous_plan():
             'execution_results': []
         }), 500
 
-def execute_single_reschedule(decision):
-    """Execute a single rescheduling decision"""
+def execute_reschedule_batch(decisions):
+    """Execute rescheduling decisions in one transaction, returning one result per decision"""
+    # Reject incomplete decisions before taking the write lock
+    results = [None if _has_reschedule_fields(decision) else {
+        'appointment_id': decision.get('appointment_id'),
+        'success': False,
+        'message': 'Données de reprogrammation incomplètes'
+    } for decision in decisions]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+    
+    # Existence and slot checks run inside the transaction against an in-memory
+    # copy of the touched days, so they see earlier moves of the same batch and
+    # cannot be invalidated by a concurrent writer; the UPDATEs then go out at once
+    updated_at = datetime.now().isoformat()  # One timestamp for the whole batch
+    with practice_db.transaction() as conn:
+        # One query for every pre-image, one for every day the batch touches
+        current_slots = practice_db.get_appointment_slots(
+            {decisions[i]['appointment_id'] for i in pending}, conn
+        )
+        touched_dates = {decisions[i]['new_date'] for i in pending}
+        touched_dates.update(slot['appointment_date'] for slot in current_slots.values())
+        day_bookings = practice_db.get_bookings_for_dates(touched_dates, conn)
+        
+        moves = []
+        for i in pending:
+            results[i], move = _plan_reschedule(decisions[i], current_slots, day_bookings)
+            if move:
+                moves.append(move)
+        
+        if moves:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                UPDATE appointments 
+                SET appointment_date = ?, appointment_time = ?, updated_at = ?
+                WHERE id = ?
+            ''', [(new_date, new_time, updated_at, appointment_id)
+                  for appointment_id, new_date, new_time in moves])
+            # Every row was read under the same write lock, so each UPDATE hits one row
+            if cursor.rowcount != len(moves):
+                raise RuntimeError(f"Expected {len(moves)} rescheduled rows, updated {cursor.rowcount}")
+    
+    for appointment_id, new_date, new_time in moves:
+        _log.info("Appointment %s rescheduled to %s %s", appointment_id, new_date, new_time)
+    return results
+
+def _has_reschedule_fields(decision):
+    """Whether a decision names an appointment and a target date and time"""
+    return all([decision.get('appointment_id'), decision.get('new_date'), decision.get('new_time')])
+
+def _plan_reschedule(decision, current_slots, day_bookings):
+    """Validate one decision against the batch's in-memory appointments and bookings.
+    
+    Returns (result, move); move is (appointment_id, new_date, new_time) when
+    the decision is accepted, in which case both maps are updated to match.
+    """
     try:
         appointment_id = decision.get('appointment_id')
         new_date = decision.get('new_date')
         new_time = decision.get('new_time')
         
-        if not all([appointment_id, new_date, new_time]):
-            return {
-                'appointment_id': appointment_id,
-                'success': False,
-                'message': 'Données de reprogrammation incomplètes'
-            }
-        
-        # Get the current appointment using the correct method
-        appointments = practice_db.get_appointments()
-        current_appointment = None
-        for apt in appointments:
-            if apt.get('id') == appointment_id:
-                current_appointment = apt
-                break
+        # The pre-image supplies both the duration to check and the old slot to report
+        current_appointment = current_slots.get(appointment_id)
         
         if not current_appointment:
             return {
                 'appointment_id': appointment_id,
                 'success': False,
                 'message': 'Rendez-vous non trouvé'
-            }
+            }, None
         
-        # Check if the new slot is available using the correct method
+        # Check the new slot against the day as already changed by this batch
         duration_minutes = current_appointment.get('duration_minutes', 60)
-        available_slots = practice_db.get_available_slots(new_date, duration_minutes)
-        
-        if new_time not in available_slots:
+        old_date = current_appointment.get('appointment_date')
+        old_day = day_bookings[old_date]
+        new_day = day_bookings[new_date]
+        if new_time not in practice_db.compute_available_slots(new_day.values(), duration_minutes):
             return {
                 'appointment_id': appointment_id,
                 'success': False,
                 'message': 'Créneau non disponible'
-            }
-        
-        # Update the appointment using direct database access
-        conn = sqlite3.connect(practice_db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE appointments 
-            SET appointment_date = ?, appointment_time = ?, updated_at = ?
-            WHERE id = ?
-        ''', (new_date, new_time, datetime.now().isoformat(), appointment_id))
-        
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+            }, None
+        
+        # Accept: move the booking in memory; the batch writes it
+        booking = old_day.pop(appointment_id, None)
+        new_day[appointment_id] = (new_time, booking[1] if booking else duration_minutes)
+        current_slots[appointment_id] = {
+            'appointment_date': new_date,
+            'appointment_time': new_time,
+            'duration_minutes': duration_minutes
+        }
         
-        if success:
-            # Log the change
-            print(f"✅ Appointment {appointment_id} rescheduled from {current_appointment.get('appointment_date')} {current_appointment.get('appointment_time')} to {new_date} {new_time}")
-            
-            return {
-                'appointment_id': appointment_id,
-                'success': True,
-                'message': f"Rendez-vous reprogrammé avec succès vers {new_date} à {new_time}",
-                'old_slot': f"{current_appointment.get('appointment_date')} à {current_appointment.get('appointment_time')}",
-                'new_slot': f"{new_date} à {new_time}"
-            }
-        else:
-            return {
-                'appointment_id': appointment_id,
-                'success': False,
-                'message': 'Échec de la mise à jour en base de données'
-            }
+        return {
+            'appointment_id': appointment_id,
+            'success': True,
+            'message': f"Rendez-vous reprogrammé avec succès vers {new_date} à {new_time}",
+            'old_slot': f"{old_date} à {current_appointment.get('appointment_time')}",
+            'new_slot': f"{new_date} à {new_time}"
+        }, (appointment_id, new_date, new_time)
             
     except Exception as e:
-        print(f"❌ Error executing single reschedule: {e}")
-        import traceback
-        traceback.print_exc()
+        _log.exception("Error executing single reschedule: %s", e)
         return {
             'appointment_id': decision.get('appointment_id'),
             'success': False,
             'message': f'Erreur lors de la reprogrammation: {str(e)}'
-        }
+        }, None
 
 if __name__ == '__main__':
     # Check if running in production (Render sets this)
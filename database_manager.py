@@ -4,59 +4,644 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any
 import uuid
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import re
+import functools
+import hashlib
+import queue
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import repeat
 from urllib.parse import urlparse
 
+# Bump whenever SCHEMA_DDL/SQLITE_SEARCH_DDL change, so existing
+# databases re-run them on the next start
+CURRENT_SCHEMA_VERSION = 4
+
+# Databases (by type and location) already brought up to date in this process
+_SCHEMA_INITIALIZED = set()
+
+# Per-connection cap on PREPAREd statements; the least recently used is DEALLOCATEd
+_PG_PREPARED_MAX = 64
+
+# A '?' placeholder, or a string literal, quoted identifier or comment whose '?' must stay as is
+_SQL_PLACEHOLDER_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|--[^\n]*|/\*.*?\*/|\?""", re.S)
+
+def _replace_placeholders(query: str, placeholder) -> tuple:
+    """Replace each '?' placeholder with placeholder(n), n counting from 1; return (sql, count)"""
+    count = 0
+    
+    def replace(match):
+        nonlocal count
+        if match.group() != '?':
+            return match.group()
+        count += 1
+        return placeholder(count)
+    
+    return _SQL_PLACEHOLDER_RE.sub(replace, query), count
+
+@functools.lru_cache(maxsize=512)
+def _pg_prepared_statement(query: str):
+    """Name a '?'-style query and build its PREPARE (with $n parameters) and EXECUTE statements.
+    
+    Returns None when the query has no placeholder outside literals and comments.
+    """
+    body, count = _replace_placeholders(query, lambda n: f'${n}')
+    if not count:
+        return None
+    name = 's_' + hashlib.sha1(query.encode()).hexdigest()[:16]
+    execute = f"EXECUTE {name} ({', '.join(['%s'] * count)})"
+    return name, f'PREPARE {name} AS {body}', execute
+
+@functools.lru_cache(maxsize=128)
+def _pg_format_query(query: str) -> str:
+    """Rewrite a '?'-style query to psycopg2's '%s' style, for queries that are not prepared"""
+    # psycopg2 reads '%' anywhere in the query, so literal ones are doubled first
+    return _replace_placeholders(query.replace('%', '%%'), lambda n: '%s')[0]
+
+_SEARCH_TOKEN_RE = re.compile(r'\w+')
+
+def _fts_prefix_query(search_term: str) -> str:
+    """Build an FTS5 MATCH expression requiring every word of the term as a token prefix"""
+    return ' '.join(f'"{token}"*' for token in _SEARCH_TOKEN_RE.findall(search_term))
+
+# get_patients variants, kept as constants so each maps to one cached statement
+_SQL_LIST_PATIENTS = 'SELECT * FROM patients ORDER BY last_name, first_name'
+_SQL_SEARCH_PATIENTS = '''
+    SELECT * FROM patients
+    WHERE first_name LIKE ? OR last_name LIKE ? OR email LIKE ?
+    ORDER BY last_name, first_name
+'''
+_SQL_MATCH_PATIENTS = '''
+    SELECT p.* FROM patients_fts f
+    JOIN patients p ON p.id = f.id
+    WHERE patients_fts MATCH ?
+    ORDER BY p.last_name, p.first_name
+'''
+
+# Shared by add_appointment and schedule_treatment_sequence
+_SQL_INSERT_APPOINTMENT = '''
+    INSERT INTO appointments (
+        id, patient_id, appointment_date, appointment_time,
+        duration_minutes, treatment_type, status, doctor,
+        room, notes, treatment_plan_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Schema shared by both backends (the column types are valid in SQLite and
+# PostgreSQL alike), run as one script by _init_sqlite/_init_postgresql
+SCHEMA_DDL = '''
+-- Patients table
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    email TEXT,
+    phone TEXT,
+    birth_date DATE,
+    address TEXT,
+    medical_history TEXT,
+    allergies TEXT,
+    emergency_contact TEXT,
+    insurance_info TEXT,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Appointments table
+CREATE TABLE IF NOT EXISTS appointments (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT,
+    appointment_date DATE NOT NULL,
+    appointment_time TIME NOT NULL,
+    duration_minutes INTEGER DEFAULT 60,
+    treatment_type TEXT,
+    status TEXT DEFAULT 'scheduled',
+    doctor TEXT DEFAULT 'Dr.',
+    room TEXT,
+    notes TEXT,
+    treatment_plan_id TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (patient_id) REFERENCES patients (id)
+);
+
+-- Slot lookups filter on date and range over time within it
+CREATE INDEX IF NOT EXISTS idx_appts_date_time
+ON appointments (appointment_date, appointment_time);
+
+-- Covers get_appointment_slots so rescheduling never reads the row itself
+-- (SQLite would otherwise pick the primary-key index and fetch the row)
+CREATE INDEX IF NOT EXISTS idx_appts_cover
+ON appointments (id, appointment_date, appointment_time, duration_minutes);
+
+-- Treatment plans table
+CREATE TABLE IF NOT EXISTS treatment_plans (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT,
+    plan_data TEXT NOT NULL,
+    consultation_text TEXT,
+    status TEXT DEFAULT 'active',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (patient_id) REFERENCES patients (id)
+);
+
+-- Schedule blocks table (for blocking time slots)
+CREATE TABLE IF NOT EXISTS schedule_blocks (
+    id TEXT PRIMARY KEY,
+    block_date DATE NOT NULL,
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    block_type TEXT DEFAULT 'unavailable',
+    reason TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Swiss dental pricing table
+CREATE TABLE IF NOT EXISTS dental_pricing (
+    id TEXT PRIMARY KEY,
+    tarmed_code TEXT UNIQUE,
+    treatment_name TEXT NOT NULL,
+    treatment_category TEXT,
+    base_price_chf REAL NOT NULL,
+    lamal_covered BOOLEAN DEFAULT FALSE,
+    lamal_percentage REAL DEFAULT 0.0,
+    description TEXT,
+    duration_minutes INTEGER DEFAULT 60,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Holds CURRENT_SCHEMA_VERSION once init_database has finished
+CREATE TABLE IF NOT EXISTS schema_meta (version INTEGER NOT NULL);
+
+-- Invoices table
+CREATE TABLE IF NOT EXISTS invoices (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    treatment_plan_id TEXT,
+    invoice_number TEXT UNIQUE NOT NULL,
+    invoice_date TEXT NOT NULL,
+    due_date TEXT,
+    total_amount_chf REAL NOT NULL,
+    lamal_amount_chf REAL DEFAULT 0.0,
+    insurance_amount_chf REAL DEFAULT 0.0,
+    patient_amount_chf REAL NOT NULL,
+    status TEXT DEFAULT 'pending',
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (patient_id) REFERENCES patients (id)
+);
+
+-- Invoice items table
+CREATE TABLE IF NOT EXISTS invoice_items (
+    id TEXT PRIMARY KEY,
+    invoice_id TEXT NOT NULL,
+    tarmed_code TEXT,
+    treatment_name TEXT NOT NULL,
+    quantity INTEGER DEFAULT 1,
+    unit_price_chf REAL NOT NULL,
+    total_price_chf REAL NOT NULL,
+    lamal_covered BOOLEAN DEFAULT FALSE,
+    lamal_amount_chf REAL DEFAULT 0.0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+);
+
+-- Payments table
+CREATE TABLE IF NOT EXISTS payments (
+    id TEXT PRIMARY KEY,
+    invoice_id TEXT NOT NULL,
+    payment_date TEXT NOT NULL,
+    amount_chf REAL NOT NULL,
+    payment_method TEXT,
+    reference_number TEXT,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+);
+
+-- Devis (estimates) table
+CREATE TABLE IF NOT EXISTS devis (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    treatment_plan_id TEXT,
+    devis_number TEXT UNIQUE NOT NULL,
+    devis_date TEXT NOT NULL,
+    valid_until TEXT,
+    total_amount_chf REAL NOT NULL,
+    lamal_amount_chf REAL DEFAULT 0.0,
+    insurance_amount_chf REAL DEFAULT 0.0,
+    patient_amount_chf REAL NOT NULL,
+    status TEXT DEFAULT 'pending',
+    approved_date TEXT,
+    rejected_date TEXT,
+    rejection_reason TEXT,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (patient_id) REFERENCES patients (id),
+    FOREIGN KEY (treatment_plan_id) REFERENCES treatment_plans (id)
+);
+
+-- Devis items table
+CREATE TABLE IF NOT EXISTS devis_items (
+    id TEXT PRIMARY KEY,
+    devis_id TEXT NOT NULL,
+    tarmed_code TEXT,
+    treatment_name TEXT NOT NULL,
+    quantity INTEGER DEFAULT 1,
+    unit_price_chf REAL NOT NULL,
+    total_price_chf REAL NOT NULL,
+    lamal_covered BOOLEAN DEFAULT FALSE,
+    lamal_amount_chf REAL DEFAULT 0.0,
+    discount_percentage REAL DEFAULT 0.0,
+    discount_amount_chf REAL DEFAULT 0.0,
+    final_price_chf REAL NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (devis_id) REFERENCES devis (id)
+);
+
+-- Payment plans table for flexible payment options
+CREATE TABLE IF NOT EXISTS payment_plans (
+    id TEXT PRIMARY KEY,
+    invoice_id TEXT NOT NULL,
+    plan_name TEXT NOT NULL,
+    total_amount_chf REAL NOT NULL,
+    number_of_payments INTEGER NOT NULL,
+    payment_frequency TEXT DEFAULT 'monthly',
+    first_payment_date TEXT NOT NULL,
+    payment_amount_chf REAL NOT NULL,
+    status TEXT DEFAULT 'active',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+);
+
+-- Scheduled payments table
+CREATE TABLE IF NOT EXISTS scheduled_payments (
+    id TEXT PRIMARY KEY,
+    payment_plan_id TEXT NOT NULL,
+    payment_number INTEGER NOT NULL,
+    scheduled_date TEXT NOT NULL,
+    amount_chf REAL NOT NULL,
+    status TEXT DEFAULT 'pending',
+    actual_payment_id TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (payment_plan_id) REFERENCES payment_plans (id),
+    FOREIGN KEY (actual_payment_id) REFERENCES payments (id)
+);
+
+-- Expected revenue table for financial forecasting
+CREATE TABLE IF NOT EXISTS expected_revenue (
+    id TEXT PRIMARY KEY,
+    invoice_id TEXT NOT NULL,
+    devis_id TEXT,
+    expected_date TEXT NOT NULL,
+    expected_amount_chf REAL NOT NULL,
+    actual_amount_chf REAL DEFAULT 0.0,
+    status TEXT DEFAULT 'pending',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+    FOREIGN KEY (devis_id) REFERENCES devis (id)
+);
+
+-- Patient education documents table
+CREATE TABLE IF NOT EXISTS patient_education (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    treatment_plan_id TEXT,
+    education_content TEXT NOT NULL,
+    education_title TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (patient_id) REFERENCES patients (id),
+    FOREIGN KEY (treatment_plan_id) REFERENCES treatment_plans (id)
+);
+
+-- Foreign-key lookups: per-patient listings (in date order), invoice/devis details
+-- and cascading deletes
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_date
+ON appointments (patient_id, appointment_date, appointment_time);
+CREATE INDEX IF NOT EXISTS idx_treatment_plans_patient_created ON treatment_plans (patient_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_patient ON invoices (patient_id);
+CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_id);
+CREATE INDEX IF NOT EXISTS idx_payments_invoice ON payments (invoice_id);
+CREATE INDEX IF NOT EXISTS idx_devis_patient ON devis (patient_id);
+CREATE INDEX IF NOT EXISTS idx_devis_items_devis ON devis_items (devis_id);
+CREATE INDEX IF NOT EXISTS idx_payment_plans_invoice ON payment_plans (invoice_id);
+CREATE INDEX IF NOT EXISTS idx_scheduled_payments_plan ON scheduled_payments (payment_plan_id);
+CREATE INDEX IF NOT EXISTS idx_expected_revenue_invoice ON expected_revenue (invoice_id);
+CREATE INDEX IF NOT EXISTS idx_patient_education_patient ON patient_education (patient_id);
+
+-- Patient listings sort by last_name, first_name
+CREATE INDEX IF NOT EXISTS idx_patients_name ON patients (last_name, first_name);
+
+-- Financial dashboard windows on invoice_date; the pricing catalogue lists by category, name
+CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (invoice_date);
+CREATE INDEX IF NOT EXISTS idx_dental_pricing_category_name ON dental_pricing (treatment_category, treatment_name);
+
+-- Superseded by the composite indexes above, which also serve their ORDER BY
+DROP INDEX IF EXISTS idx_appointments_patient;
+DROP INDEX IF EXISTS idx_treatment_plans_patient;
+'''
+
+# SQLite only: full-text patient search (PostgreSQL keeps the LIKE query)
+SQLITE_SEARCH_DDL = '''
+-- Full-text index for get_patients searches; keyed by patient id rather than
+-- rowid, which VACUUM may renumber on a table without an INTEGER PRIMARY KEY
+CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(id UNINDEXED, first_name, last_name, email);
+
+CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+    INSERT INTO patients_fts (id, first_name, last_name, email)
+    VALUES (new.id, new.first_name, new.last_name, new.email);
+END;
+
+CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF id, first_name, last_name, email ON patients BEGIN
+    DELETE FROM patients_fts WHERE id = old.id;
+    INSERT INTO patients_fts (id, first_name, last_name, email)
+    VALUES (new.id, new.first_name, new.last_name, new.email);
+END;
+
+CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+    DELETE FROM patients_fts WHERE id = old.id;
+END;
+
+-- Resync from patients whenever the schema script runs (first start or upgrade)
+DELETE FROM patients_fts;
+INSERT INTO patients_fts (id, first_name, last_name, email)
+SELECT id, first_name, last_name, email FROM patients;
+'''
+
+# Swiss dental pricing data (based on TARMED and typical Swiss fees), seeded by
+# initialize_swiss_pricing into an empty dental_pricing table
+SWISS_PRICING_DATA = [
+    # Basic treatments
+    ("00.0010", "Consultation initiale", "Consultation", 180.0, True, 90.0, "Première consultation avec examen clinique", 60),
+    ("00.0020", "Consultation de contrôle", "Consultation", 120.0, True, 90.0, "Consultation de suivi", 30),
+    ("00.0030", "Consultation d'urgence", "Consultation", 250.0, True, 90.0, "Consultation d'urgence", 45),
+
+    # Diagnostics
+    ("39.0010", "Radiographie rétro-alvéolaire", "Radiologie", 35.0, True, 90.0, "Radiographie dentaire simple", 15),
+    ("39.0020", "Radiographie panoramique", "Radiologie", 85.0, True, 90.0, "Radiographie panoramique", 20),
+    ("39.0030", "Radiographie 3D CBCT", "Radiologie", 280.0, False, 0.0, "Tomographie 3D", 30),
+
+    # Prophylaxie
+    ("01.0010", "Détartrage simple", "Prophylaxie", 120.0, True, 90.0, "Détartrage et polissage", 45),
+    ("01.0020", "Détartrage complexe", "Prophylaxie", 180.0, True, 90.0, "Détartrage approfondi", 60),
+    ("01.0030", "Scellement de fissures", "Prophylaxie", 65.0, True, 90.0, "Scellement préventif", 30),
+
+    # Soins conservateurs
+    ("04.0010", "Composite 1 face", "Composite", 180.0, True, 90.0, "Obturation composite simple", 45),
+    ("04.0020", "Composite 2 faces", "Composite", 220.0, True, 90.0, "Obturation composite moyenne", 60),
+    ("04.0030", "Composite 3 faces", "Composite", 280.0, True, 90.0, "Obturation composite complexe", 75),
+    ("04.0040", "Composite esthétique", "Composite", 350.0, False, 0.0, "Composite esthétique premium", 90),
+
+    # Endodontie
+    ("05.0010", "Traitement de canal 1 canal", "Endodontie", 450.0, True, 90.0, "Traitement endodontique simple", 90),
+    ("05.0020", "Traitement de canal 2 canaux", "Endodontie", 650.0, True, 90.0, "Traitement endodontique bicanalaire", 120),
+    ("05.0030", "Traitement de canal 3+ canaux", "Endodontie", 850.0, True, 90.0, "Traitement endodontique complexe", 150),
+    ("05.0040", "Retraitement endodontique", "Endodontie", 950.0, True, 90.0, "Retraitement de canal", 180),
+
+    # Chirurgie
+    ("06.0010", "Extraction simple", "Chirurgie", 180.0, True, 90.0, "Extraction dentaire simple", 30),
+    ("06.0020", "Extraction complexe", "Chirurgie", 280.0, True, 90.0, "Extraction chirurgicale", 60),
+    ("06.0030", "Extraction dent de sagesse", "Chirurgie", 350.0, True, 90.0, "Extraction dent de sagesse", 75),
+    ("06.0040", "Apicectomie", "Chirurgie", 650.0, True, 90.0, "Résection apicale", 90),
+
+    # Prothèses
+    ("07.0010", "Couronne métallique", "Prothèse", 950.0, True, 90.0, "Couronne métallo-céramique", 120),
+    ("07.0020", "Couronne céramique", "Prothèse", 1200.0, False, 0.0, "Couronne tout céramique", 120),
+    ("07.0030", "Couronne zircone", "Prothèse", 1450.0, False, 0.0, "Couronne zircone premium", 120),
+    ("07.0040", "Bridge 3 éléments", "Prothèse", 2850.0, True, 90.0, "Bridge fixe 3 unités", 180),
+    ("07.0050", "Prothèse partielle", "Prothèse", 1800.0, True, 90.0, "Prothèse partielle amovible", 150),
+    ("07.0060", "Prothèse complète", "Prothèse", 2200.0, True, 90.0, "Prothèse totale", 180),
+
+    # Implantologie
+    ("08.0010", "Implant dentaire", "Implantologie", 1800.0, False, 0.0, "Pose d'implant titanium", 90),
+    ("08.0020", "Couronne sur implant", "Implantologie", 1450.0, False, 0.0, "Couronne vissée sur implant", 90),
+    ("08.0030", "Greffe osseuse", "Implantologie", 850.0, False, 0.0, "Augmentation osseuse", 120),
+    ("08.0040", "Sinus lift", "Implantologie", 1200.0, False, 0.0, "Élévation sinusienne", 150),
+
+    # Parodontologie
+    ("09.0010", "Surfaçage radiculaire", "Parodontologie", 280.0, True, 90.0, "Surfaçage par quadrant", 60),
+    ("09.0020", "Chirurgie parodontale", "Parodontologie", 650.0, True, 90.0, "Chirurgie parodontale", 120),
+    ("09.0030", "Greffe gingivale", "Parodontologie", 850.0, True, 90.0, "Greffe de gencive", 90),
+
+    # Orthodontie
+    ("10.0010", "Consultation orthodontique", "Orthodontie", 180.0, False, 0.0, "Consultation orthodontique", 60),
+    ("10.0020", "Appareil orthodontique", "Orthodontie", 4500.0, False, 0.0, "Traitement orthodontique fixe", 0),
+    ("10.0030", "Invisalign", "Orthodontie", 6500.0, False, 0.0, "Traitement Invisalign", 0),
+    ("10.0040", "Contention orthodontique", "Orthodontie", 350.0, False, 0.0, "Fil de contention", 45),
+
+    # Esthétique
+    ("11.0010", "Blanchiment dentaire", "Esthétique", 650.0, False, 0.0, "Blanchiment professionnel", 90),
+    ("11.0020", "Facette céramique", "Esthétique", 1200.0, False, 0.0, "Facette en céramique", 120),
+    ("11.0030", "Facette composite", "Esthétique", 450.0, False, 0.0, "Facette en composite", 90),
+]
+
 class PracticeDatabase:
     def __init__(self, db_path: str = "practice.db"):
         self.db_path = db_path
+        # Read once here rather than at import: app.py imports this module before
+        # load_dotenv() has put DATABASE_URL into the environment
+        self.database_url = os.getenv('DATABASE_URL')
         self.db_type = self._determine_db_type()
+        # Bumped on every appointment/patient write so callers can key caches on it
+        self.schedule_version = 0
+        # Shared SQLite writer for transaction(), opened on first use
+        self._writer_conn = None
+        self._writer_lock = threading.Lock()
+        # Idle SQLite connections reused by short queries, so each keeps its
+        # parsed schema and statement cache across calls
+        self._sqlite_pool = queue.LifoQueue(maxsize=4)
+        # PostgreSQL connections are pooled too, created on first use
+        self._pg_pool = None
+        self._pg_pool_lock = threading.Lock()
+        # Statements PREPAREd on each pooled PostgreSQL connection: conn -> (epoch, names in LRU order).
+        # Bumping the epoch (after schema changes) makes each connection DEALLOCATE ALL on next use
+        self._pg_prepared = weakref.WeakKeyDictionary()
+        self._pg_prepared_epoch = 0
         self.init_database()
     
     def _determine_db_type(self):
         """Determine database type based on environment"""
-        database_url = os.getenv('DATABASE_URL')
-        if database_url and database_url.startswith('postgresql'):
+        if self.database_url and self.database_url.startswith('postgresql'):
             return 'postgresql'
         return 'sqlite'
     
     def _get_connection(self):
-        """Get database connection based on type"""
+        """Get database connection based on type (pooled for PostgreSQL)"""
         if self.db_type == 'postgresql':
-            database_url = os.getenv('DATABASE_URL')
-            if not database_url:
-                raise ValueError("DATABASE_URL environment variable is required for PostgreSQL")
-            
-            # Parse the database URL
-            parsed = urlparse(database_url)
-            
-            return psycopg2.connect(
-                host=parsed.hostname,
-                database=parsed.path[1:],  # Remove leading slash
-                user=parsed.username,
-                password=parsed.password,
-                port=parsed.port or 5432,
-                cursor_factory=RealDictCursor
-            )
+            if self._pg_pool is None:
+                with self._pg_pool_lock:
+                    if self._pg_pool is None:
+                        self._pg_pool = self._create_pg_pool()
+            return self._pg_pool.getconn()
         else:
-            return sqlite3.connect(self.db_path)
+            return self.connect_sqlite()
     
-    def _execute_query(self, query: str, params: tuple = None, fetch_one: bool = False, fetch_all: bool = False):
-        """Execute query with proper connection handling"""
-        conn = self._get_connection()
+    def _create_pg_pool(self):
+        """Create the PostgreSQL connection pool from DATABASE_URL"""
+        # psycopg2 is imported only on PostgreSQL deployments, sparing SQLite ones its load time
+        from psycopg2.extras import RealDictCursor
+        from psycopg2.pool import ThreadedConnectionPool
+        
+        if not self.database_url:
+            raise ValueError("DATABASE_URL environment variable is required for PostgreSQL")
+        
+        # Parse the database URL
+        parsed = urlparse(self.database_url)
+        
+        return ThreadedConnectionPool(
+            minconn=2,
+            maxconn=10,
+            host=parsed.hostname,
+            database=parsed.path[1:],  # Remove leading slash
+            user=parsed.username,
+            password=parsed.password,
+            port=parsed.port or 5432,
+            cursor_factory=RealDictCursor
+        )
+    
+    def _release_connection(self, conn):
+        """Hand a connection from _get_connection back for reuse"""
+        if self.db_type != 'postgresql':
+            conn.close()
+            return
+        if conn.closed:
+            self._pg_pool.putconn(conn, close=True)
+            return
+        conn.rollback()  # No-op after a commit; drops anything left uncommitted
+        self._pg_pool.putconn(conn)
+    
+    def connect_sqlite(self, **kwargs):
+        """Open a SQLite connection with the per-connection PRAGMAs applied"""
+        conn = sqlite3.connect(self.db_path, **kwargs)
+        # Safe with WAL (enabled in _init_sqlite): commits skip the fsync, checkpoints don't
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        # Pooled and writer connections live for the whole process, so a larger
+        # page cache and memory-mapped reads now pay off across queries
+        conn.execute('PRAGMA cache_size=-16384')  # 16 MiB
+        conn.execute('PRAGMA mmap_size=268435456')  # 256 MiB of address space, not RAM
+        conn.execute('PRAGMA temp_store=MEMORY')  # Sorts for ORDER BY without an index
+        return conn
+    
+    def _acquire_sqlite(self):
+        """Take an idle pooled SQLite connection, or open one"""
+        try:
+            return self._sqlite_pool.get_nowait()
+        except queue.Empty:
+            # sqlite3 keeps an LRU of compiled statements keyed by SQL text on each
+            # connection; size it like the writer's so the CRUD queries stay prepared
+            return self.connect_sqlite(check_same_thread=False, cached_statements=256)
+    
+    def _release_sqlite(self, conn):
+        """Return a connection to the pool, closing it when the pool is full"""
+        if conn.in_transaction:
+            conn.rollback()  # Never hand out a connection with a pending transaction
+        conn.row_factory = None  # Undo per-method sqlite3.Row settings
+        try:
+            self._sqlite_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    @contextmanager
+    def _pooled_sqlite(self):
+        """Borrow a pooled SQLite connection, committing on success like `with conn:`"""
+        conn = self._acquire_sqlite()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            self._release_sqlite(conn)  # Rolls back whatever an exception left pending
+    
+    @contextmanager
+    def transaction(self):
+        """Yield a connection whose writes commit together, or roll back on error"""
+        if self.db_type == 'postgresql':
+            conn = self._get_connection()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._release_connection(conn)
+                self.mark_schedule_changed()
+            return
+        
+        # SQLite admits one writer at a time anyway, so a single long-lived writer
+        # behind a lock costs no concurrency and keeps its statement cache warm
+        with self._writer_lock:
+            if self._writer_conn is None:
+                # Autocommit mode so the explicit BEGIN IMMEDIATE takes the write lock up front
+                self._writer_conn = self.connect_sqlite(
+                    isolation_level=None, check_same_thread=False, cached_statements=256
+                )
+            conn = self._writer_conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            finally:
+                self.mark_schedule_changed()
+    
+    def mark_schedule_changed(self):
+        """Invalidate caches derived from appointments or patient names"""
+        self.schedule_version += 1
+    
+    def _pg_prepared_for(self, conn, cursor) -> OrderedDict:
+        """Return the connection's prepared-statement names, dropping them if the schema changed"""
+        entry = self._pg_prepared.get(conn)
+        if entry is None or entry[0] != self._pg_prepared_epoch:
+            if entry is not None:
+                cursor.execute('DEALLOCATE ALL')
+            entry = self._pg_prepared[conn] = (self._pg_prepared_epoch, OrderedDict())
+        return entry[1]
+    
+    def _execute_query(self, query: str, params: tuple = None, fetch_one: bool = False, fetch_all: bool = False,
+                       prepare: bool = True):
+        """Execute query with proper connection handling.
+        
+        Pass prepare=False for SQL built per call (e.g. IN-lists sized to the
+        input), which would otherwise leave one prepared statement per shape.
+        """
+        conn = self._get_connection() if self.db_type == 'postgresql' else self._acquire_sqlite()
         
         try:
             if self.db_type == 'postgresql':
                 cursor = conn.cursor()
-                cursor.execute(query, params or ())
+                statement = _pg_prepared_statement(query) if params and '?' in query else None
+                if statement and prepare:
+                    # Plan once per pooled connection, then EXECUTE with only the values
+                    name, prepare_sql, execute = statement
+                    prepared = self._pg_prepared_for(conn, cursor)
+                    if name in prepared:
+                        prepared.move_to_end(name)
+                    else:
+                        if len(prepared) >= _PG_PREPARED_MAX:
+                            cursor.execute(f'DEALLOCATE {prepared.popitem(last=False)[0]}')
+                        cursor.execute(prepare_sql)
+                        prepared[name] = None
+                    cursor.execute(execute, params)
+                elif statement:
+                    cursor.execute(_pg_format_query(query), params)
+                else:
+                    # Parameterless, or already '%s'-style (e.g. the PostgreSQL restore script)
+                    cursor.execute(query, params or None)
                 
+                # RealDictCursor rows are already dict subclasses; no copy needed
                 if fetch_one:
-                    result = cursor.fetchone()
-                    return dict(result) if result else None
+                    return cursor.fetchone()
                 elif fetch_all:
-                    results = cursor.fetchall()
-                    return [dict(row) for row in results]
+                    return cursor.fetchall()
                 else:
                     conn.commit()
                     return cursor.rowcount
@@ -71,120 +656,63 @@ class PracticeDatabase:
                         return dict(zip(columns, result))
                     return None
                 elif fetch_all:
-                    results = cursor.fetchall()
                     columns = [desc[0] for desc in cursor.description]
-                    return [dict(zip(columns, row)) for row in results]
+                    # Same dicts as a zip() comprehension, without a Python-level loop per row;
+                    # reading the cursor directly skips the intermediate list of row tuples
+                    return list(map(dict, map(zip, repeat(columns), cursor)))
                 else:
                     conn.commit()
                     return cursor.rowcount
         finally:
-            conn.close()
+            if self.db_type == 'postgresql':
+                self._release_connection(conn)
+            else:
+                self._release_sqlite(conn)
 
     def init_database(self):
         """Initialize the database with required tables"""
-        # PostgreSQL and SQLite have slightly different syntax
-        if self.db_type == 'postgresql':
-            self._init_postgresql()
-        else:
-            self._init_sqlite()
+        schema_key = (self.db_type, self.database_url if self.db_type == 'postgresql' else self.db_path)
+        if schema_key in _SCHEMA_INITIALIZED:
+            return
         
-        # Initialize pricing data
-        self.initialize_swiss_pricing()
+        if self._get_schema_version() != CURRENT_SCHEMA_VERSION:
+            # PostgreSQL and SQLite have slightly different syntax
+            if self.db_type == 'postgresql':
+                self._init_postgresql()
+            else:
+                self._init_sqlite()
+            
+            # Seed pricing data into an empty table (LIMIT 1 stops at the first row, unlike COUNT(*))
+            if self._execute_query('SELECT 1 FROM dental_pricing LIMIT 1', fetch_one=True) is None:
+                self.initialize_swiss_pricing()
+            
+            self._execute_query('DELETE FROM schema_meta')
+            self._execute_query(f'INSERT INTO schema_meta (version) VALUES ({CURRENT_SCHEMA_VERSION})')
         
+        _SCHEMA_INITIALIZED.add(schema_key)
         print(f"✅ Database initialized successfully ({self.db_type})")
     
+    def _get_schema_version(self) -> Optional[int]:
+        """Read the recorded schema version, or None for a database that predates schema_meta"""
+        if self.db_type == 'postgresql':
+            from psycopg2 import Error as DatabaseError
+        else:
+            DatabaseError = sqlite3.Error
+        try:
+            row = self._execute_query('SELECT version FROM schema_meta', fetch_one=True)
+        except DatabaseError:
+            return None
+        return row['version'] if row else None
+    
     def _init_sqlite(self):
         """Initialize SQLite database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self.connect_sqlite()
         
-        # Patients table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS patients (
-                id TEXT PRIMARY KEY,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                email TEXT,
-                phone TEXT,
-                birth_date DATE,
-                address TEXT,
-                medical_history TEXT,
-                allergies TEXT,
-                emergency_contact TEXT,
-                insurance_info TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Appointments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS appointments (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT,
-                appointment_date DATE NOT NULL,
-                appointment_time TIME NOT NULL,
-                duration_minutes INTEGER DEFAULT 60,
-                treatment_type TEXT,
-                status TEXT DEFAULT 'scheduled',
-                doctor TEXT DEFAULT 'Dr.',
-                room TEXT,
-                notes TEXT,
-                treatment_plan_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id)
-            )
-        ''')
-        
-        # Treatment plans table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS treatment_plans (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT,
-                plan_data TEXT NOT NULL,
-                consultation_text TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id)
-            )
-        ''')
-        
-        # Schedule blocks table (for blocking time slots)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS schedule_blocks (
-                id TEXT PRIMARY KEY,
-                block_date DATE NOT NULL,
-                start_time TIME NOT NULL,
-                end_time TIME NOT NULL,
-                block_type TEXT DEFAULT 'unavailable',
-                reason TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Swiss dental pricing table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS dental_pricing (
-                id TEXT PRIMARY KEY,
-                tarmed_code TEXT UNIQUE,
-                treatment_name TEXT NOT NULL,
-                treatment_category TEXT,
-                base_price_chf REAL NOT NULL,
-                lamal_covered BOOLEAN DEFAULT FALSE,
-                lamal_percentage REAL DEFAULT 0.0,
-                description TEXT,
-                duration_minutes INTEGER DEFAULT 60,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Continue with other tables...
-        self._create_remaining_tables_sqlite(cursor)
+        # WAL lets readers run alongside a writer; the mode persists in the file
+        conn.execute('PRAGMA journal_mode=WAL')
         
-        conn.commit()
+        # One script, one transaction for the whole schema
+        conn.executescript(f'BEGIN;\n{SCHEMA_DDL}\n{SQLITE_SEARCH_DDL}\nCOMMIT;')
         conn.close()
     
     def _init_postgresql(self):
@@ -192,441 +720,16 @@ class PracticeDatabase:
         conn = self._get_connection()
         cursor = conn.cursor()
         
-        # Patients table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS patients (
-                id TEXT PRIMARY KEY,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                email TEXT,
-                phone TEXT,
-                birth_date DATE,
-                address TEXT,
-                medical_history TEXT,
-                allergies TEXT,
-                emergency_contact TEXT,
-                insurance_info TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Appointments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS appointments (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT,
-                appointment_date DATE NOT NULL,
-                appointment_time TIME NOT NULL,
-                duration_minutes INTEGER DEFAULT 60,
-                treatment_type TEXT,
-                status TEXT DEFAULT 'scheduled',
-                doctor TEXT DEFAULT 'Dr.',
-                room TEXT,
-                notes TEXT,
-                treatment_plan_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id)
-            )
-        ''')
-        
-        # Treatment plans table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS treatment_plans (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT,
-                plan_data TEXT NOT NULL,
-                consultation_text TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id)
-            )
-        ''')
-        
-        # Schedule blocks table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS schedule_blocks (
-                id TEXT PRIMARY KEY,
-                block_date DATE NOT NULL,
-                start_time TIME NOT NULL,
-                end_time TIME NOT NULL,
-                block_type TEXT DEFAULT 'unavailable',
-                reason TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Swiss dental pricing table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS dental_pricing (
-                id TEXT PRIMARY KEY,
-                tarmed_code TEXT UNIQUE,
-                treatment_name TEXT NOT NULL,
-                treatment_category TEXT,
-                base_price_chf REAL NOT NULL,
-                lamal_covered BOOLEAN DEFAULT FALSE,
-                lamal_percentage REAL DEFAULT 0.0,
-                description TEXT,
-                duration_minutes INTEGER DEFAULT 60,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Continue with other tables...
-        self._create_remaining_tables_postgresql(cursor)
+        # psycopg2 sends the multi-statement string in a single round-trip,
+        # inside the transaction it opened implicitly
+        cursor.execute(SCHEMA_DDL)
         
         conn.commit()
-        conn.close()
-    
-    def _create_remaining_tables_sqlite(self, cursor):
-        """Create remaining tables for SQLite"""
-        # Invoices table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT NOT NULL,
-                treatment_plan_id TEXT,
-                invoice_number TEXT UNIQUE NOT NULL,
-                invoice_date TEXT NOT NULL,
-                due_date TEXT,
-                total_amount_chf REAL NOT NULL,
-                lamal_amount_chf REAL DEFAULT 0.0,
-                insurance_amount_chf REAL DEFAULT 0.0,
-                patient_amount_chf REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id)
-            )
-        ''')
-        
-        # Invoice items table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoice_items (
-                id TEXT PRIMARY KEY,
-                invoice_id TEXT NOT NULL,
-                tarmed_code TEXT,
-                treatment_name TEXT NOT NULL,
-                quantity INTEGER DEFAULT 1,
-                unit_price_chf REAL NOT NULL,
-                total_price_chf REAL NOT NULL,
-                lamal_covered BOOLEAN DEFAULT FALSE,
-                lamal_amount_chf REAL DEFAULT 0.0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
-        ''')
-        
-        # Continue with other tables...
-        self._create_additional_tables_sqlite(cursor)
-    
-    def _create_remaining_tables_postgresql(self, cursor):
-        """Create remaining tables for PostgreSQL"""
-        # Invoices table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT NOT NULL,
-                treatment_plan_id TEXT,
-                invoice_number TEXT UNIQUE NOT NULL,
-                invoice_date TEXT NOT NULL,
-                due_date TEXT,
-                total_amount_chf REAL NOT NULL,
-                lamal_amount_chf REAL DEFAULT 0.0,
-                insurance_amount_chf REAL DEFAULT 0.0,
-                patient_amount_chf REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id)
-            )
-        ''')
-        
-        # Invoice items table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoice_items (
-                id TEXT PRIMARY KEY,
-                invoice_id TEXT NOT NULL,
-                tarmed_code TEXT,
-                treatment_name TEXT NOT NULL,
-                quantity INTEGER DEFAULT 1,
-                unit_price_chf REAL NOT NULL,
-                total_price_chf REAL NOT NULL,
-                lamal_covered BOOLEAN DEFAULT FALSE,
-                lamal_amount_chf REAL DEFAULT 0.0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
-        ''')
-        
-        # Continue with other tables...
-        self._create_additional_tables_postgresql(cursor)
-    
-    def _create_additional_tables_sqlite(self, cursor):
-        """Create additional tables for SQLite"""
-        # Payments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id TEXT PRIMARY KEY,
-                invoice_id TEXT NOT NULL,
-                payment_date TEXT NOT NULL,
-                amount_chf REAL NOT NULL,
-                payment_method TEXT,
-                reference_number TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
-        ''')
-        
-        # Devis (estimates) table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS devis (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT NOT NULL,
-                treatment_plan_id TEXT,
-                devis_number TEXT UNIQUE NOT NULL,
-                devis_date TEXT NOT NULL,
-                valid_until TEXT,
-                total_amount_chf REAL NOT NULL,
-                lamal_amount_chf REAL DEFAULT 0.0,
-                insurance_amount_chf REAL DEFAULT 0.0,
-                patient_amount_chf REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                approved_date TEXT,
-                rejected_date TEXT,
-                rejection_reason TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id),
-                FOREIGN KEY (treatment_plan_id) REFERENCES treatment_plans (id)
-            )
-        ''')
-        
-        # Continue with remaining tables...
-        self._create_final_tables_sqlite(cursor)
-    
-    def _create_additional_tables_postgresql(self, cursor):
-        """Create additional tables for PostgreSQL"""
-        # Payments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id TEXT PRIMARY KEY,
-                invoice_id TEXT NOT NULL,
-                payment_date TEXT NOT NULL,
-                amount_chf REAL NOT NULL,
-                payment_method TEXT,
-                reference_number TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
-        ''')
-        
-        # Devis (estimates) table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS devis (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT NOT NULL,
-                treatment_plan_id TEXT,
-                devis_number TEXT UNIQUE NOT NULL,
-                devis_date TEXT NOT NULL,
-                valid_until TEXT,
-                total_amount_chf REAL NOT NULL,
-                lamal_amount_chf REAL DEFAULT 0.0,
-                insurance_amount_chf REAL DEFAULT 0.0,
-                patient_amount_chf REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                approved_date TEXT,
-                rejected_date TEXT,
-                rejection_reason TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id),
-                FOREIGN KEY (treatment_plan_id) REFERENCES treatment_plans (id)
-            )
-        ''')
-        
-        # Continue with remaining tables...
-        self._create_final_tables_postgresql(cursor)
-    
-    def _create_final_tables_sqlite(self, cursor):
-        """Create final tables for SQLite"""
-        # Devis items table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS devis_items (
-                id TEXT PRIMARY KEY,
-                devis_id TEXT NOT NULL,
-                tarmed_code TEXT,
-                treatment_name TEXT NOT NULL,
-                quantity INTEGER DEFAULT 1,
-                unit_price_chf REAL NOT NULL,
-                total_price_chf REAL NOT NULL,
-                lamal_covered BOOLEAN DEFAULT FALSE,
-                lamal_amount_chf REAL DEFAULT 0.0,
-                discount_percentage REAL DEFAULT 0.0,
-                discount_amount_chf REAL DEFAULT 0.0,
-                final_price_chf REAL NOT NULL,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (devis_id) REFERENCES devis (id)
-            )
-        ''')
-        
-        # Payment plans table for flexible payment options
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payment_plans (
-                id TEXT PRIMARY KEY,
-                invoice_id TEXT NOT NULL,
-                plan_name TEXT NOT NULL,
-                total_amount_chf REAL NOT NULL,
-                number_of_payments INTEGER NOT NULL,
-                payment_frequency TEXT DEFAULT 'monthly',
-                first_payment_date TEXT NOT NULL,
-                payment_amount_chf REAL NOT NULL,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
-        ''')
-        
-        # Scheduled payments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scheduled_payments (
-                id TEXT PRIMARY KEY,
-                payment_plan_id TEXT NOT NULL,
-                payment_number INTEGER NOT NULL,
-                scheduled_date TEXT NOT NULL,
-                amount_chf REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                actual_payment_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (payment_plan_id) REFERENCES payment_plans (id),
-                FOREIGN KEY (actual_payment_id) REFERENCES payments (id)
-            )
-        ''')
-        
-        # Expected revenue table for financial forecasting
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expected_revenue (
-                id TEXT PRIMARY KEY,
-                invoice_id TEXT NOT NULL,
-                devis_id TEXT,
-                expected_date TEXT NOT NULL,
-                expected_amount_chf REAL NOT NULL,
-                actual_amount_chf REAL DEFAULT 0.0,
-                status TEXT DEFAULT 'pending',
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id),
-                FOREIGN KEY (devis_id) REFERENCES devis (id)
-            )
-        ''')
-        
-        # Patient education documents table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS patient_education (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT NOT NULL,
-                treatment_plan_id TEXT,
-                education_content TEXT NOT NULL,
-                education_title TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id),
-                FOREIGN KEY (treatment_plan_id) REFERENCES treatment_plans (id)
-            )
-        ''')
+        self._release_connection(conn)
+        
+        # Plans prepared against the old tables may no longer fit them
+        self._pg_prepared_epoch += 1
     
-    def _create_final_tables_postgresql(self, cursor):
-        """Create final tables for PostgreSQL"""
-        # Devis items table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS devis_items (
-                id TEXT PRIMARY KEY,
-                devis_id TEXT NOT NULL,
-                tarmed_code TEXT,
-                treatment_name TEXT NOT NULL,
-                quantity INTEGER DEFAULT 1,
-                unit_price_chf REAL NOT NULL,
-                total_price_chf REAL NOT NULL,
-                lamal_covered BOOLEAN DEFAULT FALSE,
-                lamal_amount_chf REAL DEFAULT 0.0,
-                discount_percentage REAL DEFAULT 0.0,
-                discount_amount_chf REAL DEFAULT 0.0,
-                final_price_chf REAL NOT NULL,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (devis_id) REFERENCES devis (id)
-            )
-        ''')
-        
-        # Payment plans table for flexible payment options
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payment_plans (
-                id TEXT PRIMARY KEY,
-                invoice_id TEXT NOT NULL,
-                plan_name TEXT NOT NULL,
-                total_amount_chf REAL NOT NULL,
-                number_of_payments INTEGER NOT NULL,
-                payment_frequency TEXT DEFAULT 'monthly',
-                first_payment_date TEXT NOT NULL,
-                payment_amount_chf REAL NOT NULL,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
-        ''')
-        
-        # Scheduled payments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scheduled_payments (
-                id TEXT PRIMARY KEY,
-                payment_plan_id TEXT NOT NULL,
-                payment_number INTEGER NOT NULL,
-                scheduled_date TEXT NOT NULL,
-                amount_chf REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                actual_payment_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (payment_plan_id) REFERENCES payment_plans (id),
-                FOREIGN KEY (actual_payment_id) REFERENCES payments (id)
-            )
-        ''')
-        
-        # Expected revenue table for financial forecasting
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expected_revenue (
-                id TEXT PRIMARY KEY,
-                invoice_id TEXT NOT NULL,
-                devis_id TEXT,
-                expected_date TEXT NOT NULL,
-                expected_amount_chf REAL NOT NULL,
-                actual_amount_chf REAL DEFAULT 0.0,
-                status TEXT DEFAULT 'pending',
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id),
-                FOREIGN KEY (devis_id) REFERENCES devis (id)
-            )
-        ''')
-        
-        # Patient education documents table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS patient_education (
-                id TEXT PRIMARY KEY,
-                patient_id TEXT NOT NULL,
-                treatment_plan_id TEXT,
-                education_content TEXT NOT NULL,
-                education_title TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (patient_id) REFERENCES patients (id),
-                FOREIGN KEY (treatment_plan_id) REFERENCES treatment_plans (id)
-            )
-        ''')
-
     def add_patient(self, patient_data: Dict[str, Any]) -> str:
         """Add a new patient"""
         patient_id = str(uuid.uuid4())
@@ -658,17 +761,23 @@ class PracticeDatabase:
         return patient_id
     
     def get_patients(self, search_term: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get all patients or search by name/email"""
+        """Get all patients or search by name/email.
+        
+        On SQLite the search matches word prefixes through the FTS index first,
+        and falls back to a substring LIKE scan only when that finds nobody.
+        """
+        match = _fts_prefix_query(search_term) if search_term and self.db_type == 'sqlite' else ''
+        if match:
+            patients = self._execute_query(_SQL_MATCH_PATIENTS, (match,), fetch_all=True)
+            if patients:
+                return patients
+            # Token prefixes miss mid-word and suffix terms ("ean" in "Jean"), which LIKE still finds
+        
         if search_term:
-            query = '''
-                SELECT * FROM patients 
-                WHERE first_name LIKE ? OR last_name LIKE ? OR email LIKE ?
-                ORDER BY last_name, first_name
-            '''
-            params = (f'%{search_term}%', f'%{search_term}%', f'%{search_term}%')
+            pattern = f'%{search_term}%'
+            query, params = _SQL_SEARCH_PATIENTS, (pattern, pattern, pattern)
         else:
-            query = 'SELECT * FROM patients ORDER BY last_name, first_name'
-            params = None
+            query, params = _SQL_LIST_PATIENTS, None
         
         return self._execute_query(query, params, fetch_all=True)
 
@@ -679,6 +788,15 @@ class PracticeDatabase:
         
         return self._execute_query(query, params, fetch_one=True)
 
+    def get_patients_by_ids(self, patient_ids: List[str]) -> List[Dict[str, Any]]:
+        """Get several patients by ID in one query"""
+        if not patient_ids:
+            return []
+        placeholders = ', '.join('?' * len(patient_ids))
+        query = f'SELECT * FROM patients WHERE id IN ({placeholders})'
+        
+        return self._execute_query(query, tuple(patient_ids), fetch_all=True, prepare=False)
+
     def create_patient(self, **patient_data) -> str:
         """Create a new patient"""
         patient_id = str(uuid.uuid4())
@@ -687,8 +805,8 @@ class PracticeDatabase:
             INSERT INTO patients (
                 id, first_name, last_name, email, phone, birth_date,
                 address, medical_history, allergies, emergency_contact,
-                insurance_info, notes, created_at, updated_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                insurance_info, notes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         '''
         
         params = (
@@ -703,26 +821,27 @@ class PracticeDatabase:
             patient_data.get('allergies'),
             patient_data.get('emergency_contact'),
             patient_data.get('insurance_info'),
-            patient_data.get('notes'),
-            datetime.now().isoformat(),
-            datetime.now().isoformat()
+            patient_data.get('notes')
         )
         
         self._execute_query(query, params)
         return patient_id
 
     def update_patient(self, patient_id: str, **patient_data) -> bool:
-        """Update an existing patient"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        """Update an existing patient; fields missing from patient_data (or None) keep their value"""
+        query = '''
             UPDATE patients SET
-                first_name = ?, last_name = ?, email = ?, phone = ?, birth_date = ?,
-                address = ?, medical_history = ?, allergies = ?, emergency_contact = ?,
-                insurance_info = ?, notes = ?, updated_at = ?
+                first_name = COALESCE(?, first_name), last_name = COALESCE(?, last_name),
+                email = COALESCE(?, email), phone = COALESCE(?, phone),
+                birth_date = COALESCE(?, birth_date), address = COALESCE(?, address),
+                medical_history = COALESCE(?, medical_history), allergies = COALESCE(?, allergies),
+                emergency_contact = COALESCE(?, emergency_contact),
+                insurance_info = COALESCE(?, insurance_info), notes = COALESCE(?, notes),
+                updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
-        ''', (
+        '''
+        
+        params = (
             patient_data.get('first_name'),
             patient_data.get('last_name'),
             patient_data.get('email'),
@@ -734,28 +853,18 @@ class PracticeDatabase:
             patient_data.get('emergency_contact'),
             patient_data.get('insurance_info'),
             patient_data.get('notes'),
-            datetime.now().isoformat(),
             patient_id
-        ))
+        )
         
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        success = self._execute_query(query, params) > 0
+        self.mark_schedule_changed()
         return success
 
     def add_appointment(self, appointment_data: Dict[str, Any]) -> str:
         """Add a new appointment"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         appointment_id = str(uuid.uuid4())
-        cursor.execute('''
-            INSERT INTO appointments (
-                id, patient_id, appointment_date, appointment_time,
-                duration_minutes, treatment_type, status, doctor,
-                room, notes, treatment_plan_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        
+        params = (
             appointment_id,
             appointment_data.get('patient_id'),
             appointment_data.get('appointment_date'),
@@ -767,15 +876,15 @@ class PracticeDatabase:
             appointment_data.get('room', ''),
             appointment_data.get('notes', ''),
             appointment_data.get('treatment_plan_id', '')
-        ))
+        )
         
-        conn.commit()
-        conn.close()
+        self._execute_query(_SQL_INSERT_APPOINTMENT, params)
+        self.mark_schedule_changed()
         return appointment_id
 
     def get_appointments(self, date: str = None, patient_id: str = None) -> List[Dict]:
         """Get appointments by date or patient"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         query = '''
@@ -801,12 +910,37 @@ class PracticeDatabase:
         columns = [desc[0] for desc in cursor.description]
         appointments = [dict(zip(columns, row)) for row in cursor.fetchall()]
         
-        conn.close()
+        self._release_sqlite(conn)
         return appointments
 
+    def get_appointment_slots(self, appointment_ids, conn=None) -> Dict[str, Dict[str, Any]]:
+        """Map appointment ID -> date, time and duration for several appointments in one query"""
+        appointment_ids = list(appointment_ids)
+        if not appointment_ids:
+            return {}
+        
+        own_conn = conn is None
+        if own_conn:
+            conn = self._acquire_sqlite()
+        cursor = conn.cursor()
+        
+        placeholders = ', '.join('?' * len(appointment_ids))
+        cursor.execute(f'''
+            SELECT id, appointment_date, appointment_time, duration_minutes 
+            FROM appointments INDEXED BY idx_appts_cover WHERE id IN ({placeholders})
+        ''', appointment_ids)
+        
+        slots = {
+            appointment_id: {'appointment_date': date, 'appointment_time': time, 'duration_minutes': duration}
+            for appointment_id, date, time, duration in cursor.fetchall()
+        }
+        if own_conn:
+            self._release_sqlite(conn)
+        return slots
+
     def get_schedule_for_week(self, start_date: str) -> List[Dict]:
         """Get appointments for a week starting from start_date"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         # Calculate end date (7 days later)
@@ -825,12 +959,12 @@ class PracticeDatabase:
         columns = [desc[0] for desc in cursor.description]
         appointments = [dict(zip(columns, row)) for row in cursor.fetchall()]
         
-        conn.close()
+        self._release_sqlite(conn)
         return appointments
 
     def save_treatment_plan(self, patient_id: str, plan_data: Dict, consultation_text: str = '') -> str:
         """Save a treatment plan for a patient"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         plan_id = str(uuid.uuid4())
@@ -840,12 +974,12 @@ class PracticeDatabase:
         ''', (plan_id, patient_id, json.dumps(plan_data), consultation_text))
         
         conn.commit()
-        conn.close()
+        self._release_sqlite(conn)
         return plan_id
 
     def get_treatment_plans(self, patient_id: str) -> List[Dict]:
         """Get treatment plans for a patient"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -862,7 +996,7 @@ class PracticeDatabase:
             plan['plan_data'] = json.loads(plan['plan_data'])
             plans.append(plan)
         
-        conn.close()
+        self._release_sqlite(conn)
         return plans
 
     def create_treatment_plan(self, patient_id: str = None, consultation_text: str = '', 
@@ -870,7 +1004,7 @@ class PracticeDatabase:
                              created_at: str = None, status: str = 'draft', **kwargs) -> str:
         """Create a new treatment plan"""
         plan_id = str(uuid.uuid4())
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         # Handle both old and new calling patterns
@@ -901,13 +1035,14 @@ class PracticeDatabase:
         ))
         
         conn.commit()
-        conn.close()
+        self._release_sqlite(conn)
         return plan_id
 
     def schedule_treatment_sequence(self, patient_id: str, treatment_plan_id: str, 
                                   treatment_sequence: List[Dict], start_date: str) -> List[str]:
         """Schedule appointments for a treatment sequence"""
         appointment_ids = []
+        rows = []
         current_date = datetime.strptime(start_date, '%Y-%m-%d')
         
         for i, treatment in enumerate(treatment_sequence):
@@ -927,20 +1062,21 @@ class PracticeDatabase:
                 except:
                     duration_minutes = 60
             
-            # Create appointment
-            appointment_data = {
-                'patient_id': patient_id,
-                'appointment_date': current_date.strftime('%Y-%m-%d'),
-                'appointment_time': '09:00',  # Default time, can be customized
-                'duration_minutes': duration_minutes,
-                'treatment_type': treatment.get('traitement', 'Traitement dentaire'),
-                'status': 'scheduled',
-                'doctor': treatment.get('dr', 'Dr.'),
-                'notes': treatment.get('remarque', ''),
-                'treatment_plan_id': treatment_plan_id
-            }
-            
-            appointment_id = self.add_appointment(appointment_data)
+            # Queue the appointment; all of them are inserted together below
+            appointment_id = str(uuid.uuid4())
+            rows.append((
+                appointment_id,
+                patient_id,
+                current_date.strftime('%Y-%m-%d'),
+                '09:00',  # Default time, can be customized
+                duration_minutes,
+                treatment.get('traitement', 'Traitement dentaire'),
+                'scheduled',
+                treatment.get('dr', 'Dr.'),
+                '',
+                treatment.get('remarque', ''),
+                treatment_plan_id
+            ))
             appointment_ids.append(appointment_id)
             
             # Calculate next appointment date based on delay
@@ -960,11 +1096,17 @@ class PracticeDatabase:
             else:
                 current_date += timedelta(weeks=1)  # Default 1 week
         
+        # One transaction and one executemany instead of a connection and commit per row
+        if rows:
+            query = _SQL_INSERT_APPOINTMENT if self.db_type == 'sqlite' else _SQL_INSERT_APPOINTMENT.replace('?', '%s')
+            with self.transaction() as conn:
+                conn.cursor().executemany(query, rows)
+        
         return appointment_ids
 
     def get_appointments_for_date(self, date: str) -> List[Dict[str, Any]]:
         """Get all appointments for a specific date"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -977,12 +1119,12 @@ class PracticeDatabase:
         ''', (date,))
         
         appointments = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        self._release_sqlite(conn)
         return appointments
 
     def get_appointments_by_date_range(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """Get all appointments within a date range"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1008,12 +1150,14 @@ class PracticeDatabase:
                 'duration': f"{row[4]} min"
             })
         
-        conn.close()
+        self._release_sqlite(conn)
         return appointments
 
-    def get_available_slots(self, date: str, duration_minutes: int = 60) -> List[str]:
-        """Get available time slots for a given date"""
-        conn = sqlite3.connect(self.db_path)
+    def get_available_slots(self, date: str, duration_minutes: int = 60, conn=None) -> List[str]:
+        """Get available time slots for a given date (optionally inside a transaction)"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         # Get existing appointments for the date
@@ -1025,32 +1169,92 @@ class PracticeDatabase:
         ''', (date,))
         
         booked_slots = cursor.fetchall()
-        conn.close()
+        if own_conn:
+            self._release_sqlite(conn)
+        
+        return self.compute_available_slots(booked_slots, duration_minutes)
+
+    def get_bookings_for_dates(self, dates, conn=None) -> Dict[str, Dict[str, tuple]]:
+        """Map each date -> {appointment ID: (time, duration)} of its non-cancelled bookings"""
+        dates = list(dates)
+        bookings = {date: {} for date in dates}
+        if not dates:
+            return bookings
+        
+        own_conn = conn is None
+        if own_conn:
+            conn = self._acquire_sqlite()
+        cursor = conn.cursor()
+        
+        placeholders = ', '.join('?' * len(dates))
+        cursor.execute(f'''
+            SELECT appointment_date, id, appointment_time, duration_minutes 
+            FROM appointments 
+            WHERE appointment_date IN ({placeholders}) AND status != 'cancelled'
+        ''', dates)
+        
+        for date, appointment_id, time, duration in cursor.fetchall():
+            bookings[date][appointment_id] = (time, duration)
+        if own_conn:
+            self._release_sqlite(conn)
+        return bookings
+
+    def get_booked_slots_by_date(self, start_date: str, end_date: str) -> Dict[str, List[tuple]]:
+        """Get (time, duration) of booked appointments per date within a date range"""
+        conn = self._acquire_sqlite()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT appointment_date, appointment_time, duration_minutes 
+            FROM appointments 
+            WHERE appointment_date BETWEEN ? AND ? AND status != 'cancelled'
+            ORDER BY appointment_date, appointment_time
+        ''', (start_date, end_date))
+        
+        booked_by_date = {}
+        for appointment_date, appointment_time, duration in cursor.fetchall():
+            booked_by_date.setdefault(appointment_date, []).append((appointment_time, duration))
         
+        self._release_sqlite(conn)
+        return booked_by_date
+
+    @staticmethod
+    def compute_available_slots(booked_slots, duration_minutes: int = 60) -> List[str]:
+        """Compute free slots of a day from its booked (time, duration) pairs"""
         # Define working hours (9 AM to 6 PM)
         working_start = 9 * 60  # 9:00 AM in minutes
         working_end = 18 * 60   # 6:00 PM in minutes
         
-        # Generate all possible slots
+        # Convert each booking to a (start, end) minute interval once, not per slot
+        booked_intervals = []
+        for booked_time, booked_duration in booked_slots:
+            hours, _, minutes = booked_time.partition(':')
+            booked_minutes = int(hours) * 60 + int(minutes[:2])
+            booked_intervals.append((booked_minutes, booked_minutes + booked_duration))
+        
+        # Merge into disjoint busy periods sorted by start (so their ends are sorted too)
+        busy = []
+        for booked_start, booked_end in sorted(booked_intervals):
+            if busy and booked_start <= busy[-1][1]:
+                busy[-1][1] = max(busy[-1][1], booked_end)
+            else:
+                busy.append([booked_start, booked_end])
+        
+        # Sweep candidate slots and busy periods together instead of testing every pair
         available_slots = []
         current_time = working_start
+        i = 0
         
         while current_time + duration_minutes <= working_end:
-            slot_time = f"{current_time // 60:02d}:{current_time % 60:02d}"
+            slot_end = current_time + duration_minutes
             
-            # Check if this slot conflicts with existing appointments
-            conflicts = False
-            for booked_time, booked_duration in booked_slots:
-                booked_minutes = int(booked_time.split(':')[0]) * 60 + int(booked_time.split(':')[1])
-                
-                # Check for overlap
-                if (current_time < booked_minutes + booked_duration and 
-                    current_time + duration_minutes > booked_minutes):
-                    conflicts = True
-                    break
+            # Skip busy periods that end before this slot starts
+            while i < len(busy) and busy[i][1] <= current_time:
+                i += 1
             
-            if not conflicts:
-                available_slots.append(slot_time)
+            # Only the next busy period can overlap this slot
+            if i == len(busy) or busy[i][0] >= slot_end:
+                available_slots.append(f"{current_time // 60:02d}:{current_time % 60:02d}")
             
             current_time += 30  # 30-minute intervals
         
@@ -1058,19 +1262,20 @@ class PracticeDatabase:
 
     def delete_appointment(self, appointment_id: str) -> bool:
         """Delete an appointment"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM appointments WHERE id = ?', (appointment_id,))
         success = cursor.rowcount > 0
         
         conn.commit()
-        conn.close()
+        self._release_sqlite(conn)
+        self.mark_schedule_changed()
         return success
 
     def update_appointment_status(self, appointment_id: str, status: str) -> bool:
         """Update appointment status"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1081,12 +1286,13 @@ class PracticeDatabase:
         
         success = cursor.rowcount > 0
         conn.commit()
-        conn.close()
+        self._release_sqlite(conn)
+        self.mark_schedule_changed()
         return success 
 
     def get_appointments(self, week_start: Optional[str] = None, patient_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get appointments for a specific week or patient"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -1117,7 +1323,7 @@ class PracticeDatabase:
             ''')
         
         appointments = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        self._release_sqlite(conn)
         return appointments
 
     def create_appointment(self, **appointment_data) -> str:
@@ -1147,6 +1353,7 @@ class PracticeDatabase:
         )
         
         self._execute_query(query, params)
+        self.mark_schedule_changed()
         return appointment_id
 
     def get_patient_details(self, patient_id: str) -> Dict[str, Any]:
@@ -1155,7 +1362,7 @@ class PracticeDatabase:
         if not patient:
             return None
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -1183,7 +1390,7 @@ class PracticeDatabase:
         ''', (patient_id,))
         education_documents = [dict(row) for row in cursor.fetchall()]
         
-        conn.close()
+        self._release_sqlite(conn)
         
         return {
             'patient': patient,
@@ -1194,96 +1401,43 @@ class PracticeDatabase:
 
     def close(self):
         """Close database connection (if needed)"""
-        pass 
+        with self._writer_lock:
+            if self._writer_conn is not None:
+                self._writer_conn.close()
+                self._writer_conn = None
+        while True:
+            try:
+                self._sqlite_pool.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._pg_pool_lock:
+            if self._pg_pool is not None:
+                self._pg_pool.closeall()
+                self._pg_pool = None
 
     def initialize_swiss_pricing(self):
         """Initialize Swiss dental pricing based on TARMED and typical Swiss dental fees"""
         try:
-            # Check if pricing data already exists
-            count_result = self._execute_query("SELECT COUNT(*) FROM dental_pricing", fetch_one=True)
-            if count_result and list(count_result.values())[0] > 0:
-                print("✅ Swiss dental pricing already initialized")
-                return
-                
-                # Swiss dental pricing data (based on TARMED and typical Swiss fees)
-                pricing_data = [
-                    # Basic treatments
-                    ("00.0010", "Consultation initiale", "Consultation", 180.0, True, 90.0, "Première consultation avec examen clinique", 60),
-                    ("00.0020", "Consultation de contrôle", "Consultation", 120.0, True, 90.0, "Consultation de suivi", 30),
-                    ("00.0030", "Consultation d'urgence", "Consultation", 250.0, True, 90.0, "Consultation d'urgence", 45),
-                    
-                    # Diagnostics
-                    ("39.0010", "Radiographie rétro-alvéolaire", "Radiologie", 35.0, True, 90.0, "Radiographie dentaire simple", 15),
-                    ("39.0020", "Radiographie panoramique", "Radiologie", 85.0, True, 90.0, "Radiographie panoramique", 20),
-                    ("39.0030", "Radiographie 3D CBCT", "Radiologie", 280.0, False, 0.0, "Tomographie 3D", 30),
-                    
-                    # Prophylaxie
-                    ("01.0010", "Détartrage simple", "Prophylaxie", 120.0, True, 90.0, "Détartrage et polissage", 45),
-                    ("01.0020", "Détartrage complexe", "Prophylaxie", 180.0, True, 90.0, "Détartrage approfondi", 60),
-                    ("01.0030", "Scellement de fissures", "Prophylaxie", 65.0, True, 90.0, "Scellement préventif", 30),
-                    
-                    # Soins conservateurs
-                    ("04.0010", "Composite 1 face", "Composite", 180.0, True, 90.0, "Obturation composite simple", 45),
-                    ("04.0020", "Composite 2 faces", "Composite", 220.0, True, 90.0, "Obturation composite moyenne", 60),
-                    ("04.0030", "Composite 3 faces", "Composite", 280.0, True, 90.0, "Obturation composite complexe", 75),
-                    ("04.0040", "Composite esthétique", "Composite", 350.0, False, 0.0, "Composite esthétique premium", 90),
-                    
-                    # Endodontie
-                    ("05.0010", "Traitement de canal 1 canal", "Endodontie", 450.0, True, 90.0, "Traitement endodontique simple", 90),
-                    ("05.0020", "Traitement de canal 2 canaux", "Endodontie", 650.0, True, 90.0, "Traitement endodontique bicanalaire", 120),
-                    ("05.0030", "Traitement de canal 3+ canaux", "Endodontie", 850.0, True, 90.0, "Traitement endodontique complexe", 150),
-                    ("05.0040", "Retraitement endodontique", "Endodontie", 950.0, True, 90.0, "Retraitement de canal", 180),
-                    
-                    # Chirurgie
-                    ("06.0010", "Extraction simple", "Chirurgie", 180.0, True, 90.0, "Extraction dentaire simple", 30),
-                    ("06.0020", "Extraction complexe", "Chirurgie", 280.0, True, 90.0, "Extraction chirurgicale", 60),
-                    ("06.0030", "Extraction dent de sagesse", "Chirurgie", 350.0, True, 90.0, "Extraction dent de sagesse", 75),
-                    ("06.0040", "Apicectomie", "Chirurgie", 650.0, True, 90.0, "Résection apicale", 90),
-                    
-                    # Prothèses
-                    ("07.0010", "Couronne métallique", "Prothèse", 950.0, True, 90.0, "Couronne métallo-céramique", 120),
-                    ("07.0020", "Couronne céramique", "Prothèse", 1200.0, False, 0.0, "Couronne tout céramique", 120),
-                    ("07.0030", "Couronne zircone", "Prothèse", 1450.0, False, 0.0, "Couronne zircone premium", 120),
-                    ("07.0040", "Bridge 3 éléments", "Prothèse", 2850.0, True, 90.0, "Bridge fixe 3 unités", 180),
-                    ("07.0050", "Prothèse partielle", "Prothèse", 1800.0, True, 90.0, "Prothèse partielle amovible", 150),
-                    ("07.0060", "Prothèse complète", "Prothèse", 2200.0, True, 90.0, "Prothèse totale", 180),
-                    
-                    # Implantologie
-                    ("08.0010", "Implant dentaire", "Implantologie", 1800.0, False, 0.0, "Pose d'implant titanium", 90),
-                    ("08.0020", "Couronne sur implant", "Implantologie", 1450.0, False, 0.0, "Couronne vissée sur implant", 90),
-                    ("08.0030", "Greffe osseuse", "Implantologie", 850.0, False, 0.0, "Augmentation osseuse", 120),
-                    ("08.0040", "Sinus lift", "Implantologie", 1200.0, False, 0.0, "Élévation sinusienne", 150),
-                    
-                    # Parodontologie
-                    ("09.0010", "Surfaçage radiculaire", "Parodontologie", 280.0, True, 90.0, "Surfaçage par quadrant", 60),
-                    ("09.0020", "Chirurgie parodontale", "Parodontologie", 650.0, True, 90.0, "Chirurgie parodontale", 120),
-                    ("09.0030", "Greffe gingivale", "Parodontologie", 850.0, True, 90.0, "Greffe de gencive", 90),
-                    
-                    # Orthodontie
-                    ("10.0010", "Consultation orthodontique", "Orthodontie", 180.0, False, 0.0, "Consultation orthodontique", 60),
-                    ("10.0020", "Appareil orthodontique", "Orthodontie", 4500.0, False, 0.0, "Traitement orthodontique fixe", 0),
-                    ("10.0030", "Invisalign", "Orthodontie", 6500.0, False, 0.0, "Traitement Invisalign", 0),
-                    ("10.0040", "Contention orthodontique", "Orthodontie", 350.0, False, 0.0, "Fil de contention", 45),
-                    
-                    # Esthétique
-                    ("11.0010", "Blanchiment dentaire", "Esthétique", 650.0, False, 0.0, "Blanchiment professionnel", 90),
-                    ("11.0020", "Facette céramique", "Esthétique", 1200.0, False, 0.0, "Facette en céramique", 120),
-                    ("11.0030", "Facette composite", "Esthétique", 450.0, False, 0.0, "Facette en composite", 90),
-                ]
-                
-                # Insert pricing data
-                for item in pricing_data:
-                    pricing_id = str(uuid.uuid4())
-                    query = '''
-                        INSERT INTO dental_pricing 
-                        (id, tarmed_code, treatment_name, treatment_category, base_price_chf, 
-                         lamal_covered, lamal_percentage, description, duration_minutes)
+            # Insert all rows in one batch and one commit; tarmed_code is UNIQUE,
+            # so a second process seeding at the same time inserts nothing
+            columns = '''id, tarmed_code, treatment_name, treatment_category, base_price_chf,
+                         lamal_covered, lamal_percentage, description, duration_minutes'''
+            rows = [(str(uuid.uuid4()), *item) for item in SWISS_PRICING_DATA]
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                if self.db_type == 'postgresql':
+                    from psycopg2.extras import execute_values
+                    execute_values(cursor, f'''
+                        INSERT INTO dental_pricing ({columns}) VALUES %s
+                        ON CONFLICT (tarmed_code) DO NOTHING
+                    ''', rows)
+                else:
+                    cursor.executemany(f'''
+                        INSERT OR IGNORE INTO dental_pricing ({columns})
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    '''
-                    params = (pricing_id, *item)
-                    self._execute_query(query, params)
-                
-                print(f"✅ Swiss dental pricing initialized with {len(pricing_data)} treatments")
+                    ''', rows)
+            
+            print(f"✅ Swiss dental pricing initialized with {len(rows)} treatments")
                 
         except Exception as e:
             print(f"❌ Error initializing Swiss pricing: {e}")
@@ -1293,7 +1447,7 @@ class PracticeDatabase:
     def create_invoice(self, patient_id, treatment_items, invoice_date=None, due_date=None, treatment_plan_id=None):
         """Create a new invoice for a patient"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Generate invoice number
@@ -1301,23 +1455,29 @@ class PracticeDatabase:
                 year_count = cursor.fetchone()[0] + 1
                 invoice_number = f"INV-{datetime.now().year}-{year_count:04d}"
                 
-                # Calculate totals
+                # Calculate totals and build the invoice item rows in the same pass
+                invoice_id = str(uuid.uuid4())
                 total_amount = 0.0
                 lamal_amount = 0.0
                 insurance_amount = 0.0
+                item_rows = []
                 
                 for item in treatment_items:
                     item_total = item['quantity'] * item['unit_price']
                     total_amount += item_total
                     
+                    item_lamal = 0
                     if item.get('lamal_covered', False):
-                        lamal_item_amount = item_total * (item.get('lamal_percentage', 0) / 100)
-                        lamal_amount += lamal_item_amount
+                        item_lamal = item_total * (item.get('lamal_percentage', 0) / 100)
+                        lamal_amount += item_lamal
+                    
+                    item_rows.append((str(uuid.uuid4()), invoice_id, item.get('tarmed_code', ''), item['treatment_name'],
+                                      item['quantity'], item['unit_price'], item_total,
+                                      item.get('lamal_covered', False), item_lamal))
                 
                 patient_amount = total_amount - lamal_amount - insurance_amount
                 
                 # Create invoice
-                invoice_id = str(uuid.uuid4())
                 if not invoice_date:
                     invoice_date = datetime.now().strftime('%Y-%m-%d')
                 if not due_date:
@@ -1332,19 +1492,12 @@ class PracticeDatabase:
                       total_amount, lamal_amount, insurance_amount, patient_amount))
                 
                 # Create invoice items
-                for item in treatment_items:
-                    item_id = str(uuid.uuid4())
-                    item_total = item['quantity'] * item['unit_price']
-                    item_lamal = item_total * (item.get('lamal_percentage', 0) / 100) if item.get('lamal_covered', False) else 0
-                    
-                    cursor.execute('''
-                        INSERT INTO invoice_items 
-                        (id, invoice_id, tarmed_code, treatment_name, quantity, unit_price_chf, 
-                         total_price_chf, lamal_covered, lamal_amount_chf)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (item_id, invoice_id, item.get('tarmed_code', ''), item['treatment_name'],
-                          item['quantity'], item['unit_price'], item_total, 
-                          item.get('lamal_covered', False), item_lamal))
+                cursor.executemany('''
+                    INSERT INTO invoice_items 
+                    (id, invoice_id, tarmed_code, treatment_name, quantity, unit_price_chf, 
+                     total_price_chf, lamal_covered, lamal_amount_chf)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', item_rows)
                 
                 conn.commit()
                 return invoice_id
@@ -1356,7 +1509,7 @@ class PracticeDatabase:
     def get_pricing_data(self, search_term=None):
         """Get dental pricing data with optional search"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 if search_term:
@@ -1383,7 +1536,7 @@ class PracticeDatabase:
     def get_financial_dashboard_data(self):
         """Get financial dashboard data for analytics"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Monthly revenue
@@ -1448,7 +1601,7 @@ class PracticeDatabase:
     def get_invoices(self, patient_id=None, status=None, invoice_id=None):
         """Get invoices with optional filters"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 query = '''
@@ -1485,7 +1638,7 @@ class PracticeDatabase:
     def get_invoice_items(self, invoice_id):
         """Get items for a specific invoice"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -1506,7 +1659,7 @@ class PracticeDatabase:
     def add_payment(self, invoice_id, amount, payment_date=None, payment_method='cash', reference_number=None):
         """Add a payment to an invoice"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Create payment record
@@ -1552,7 +1705,7 @@ class PracticeDatabase:
     def create_devis(self, patient_id, treatment_plan_id, devis_items, valid_days=30):
         """Create a new devis (estimate) for a patient"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Generate devis number
@@ -1621,7 +1774,7 @@ class PracticeDatabase:
     def get_devis(self, patient_id=None, status=None, devis_id=None):
         """Get devis with optional filters"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 query = '''
@@ -1674,7 +1827,7 @@ class PracticeDatabase:
     def approve_devis(self, devis_id):
         """Approve a devis"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -1693,7 +1846,7 @@ class PracticeDatabase:
     def reject_devis(self, devis_id, reason=""):
         """Reject a devis"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -1712,7 +1865,7 @@ class PracticeDatabase:
     def create_invoice_from_devis(self, devis_id, selected_items=None):
         """Create an invoice from an approved devis"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Get devis details
@@ -1772,7 +1925,7 @@ class PracticeDatabase:
     def create_payment_plan(self, invoice_id, plan_name, number_of_payments, frequency='monthly', first_payment_date=None):
         """Create a payment plan for an invoice"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Get invoice details
@@ -1828,7 +1981,7 @@ class PracticeDatabase:
     def create_patient_education(self, patient_id, education_content, education_title=None, treatment_plan_id=None):
         """Create a new patient education document"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 education_id = str(uuid.uuid4())
@@ -1849,7 +2002,7 @@ class PracticeDatabase:
     def get_patient_education(self, patient_id=None, education_id=None):
         """Get patient education documents"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 if education_id:
@@ -1896,7 +2049,7 @@ class PracticeDatabase:
     def update_patient_education(self, education_id, education_content, education_title=None):
         """Update an existing patient education document"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -1916,7 +2069,7 @@ class PracticeDatabase:
     def get_payment_plans(self, invoice_id=None):
         """Get payment plans"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 query = '''
@@ -1962,7 +2115,7 @@ class PracticeDatabase:
     def update_expected_revenue(self, invoice_id, actual_amount):
         """Update expected revenue when payment is received"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -1987,7 +2140,7 @@ class PracticeDatabase:
     def get_revenue_forecast(self, months_ahead=12):
         """Get revenue forecast based on expected payments"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Get expected revenue
@@ -2014,7 +2167,7 @@ class PracticeDatabase:
     def delete_devis(self, devis_id):
         """Delete a devis and its items"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Delete devis items first (due to foreign key constraints)
@@ -2034,7 +2187,7 @@ class PracticeDatabase:
     def delete_invoice(self, invoice_id):
         """Delete an invoice and its related data"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pooled_sqlite() as conn:
                 cursor = conn.cursor()
                 
                 # Delete payments first (due to foreign key constraints)
@@ -22,8 +22,12 @@ def export_sqlite_data(sqlite_path="practice.db"):
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
-    # Get all table names
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    # Get all table names, except bookkeeping the target schema recreates itself
+    # (the schema version and the patient search index, rebuilt from patients)
+    cursor.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type='table' AND name != 'schema_meta' AND name NOT LIKE 'patients_fts%'
+    """)
     tables = [row[0] for row in cursor.fetchall()]
     
     export_data = {
@@ -0,0 +1,37 @@
+import unittest
+
+import treatment_parser
+
+
+def substring_scan(token):
+    """Reference resolution: first color key contained in the token, then first icon key"""
+    folded = token.translate(treatment_parser._FOLD_TABLE)
+    for key, value in treatment_parser.TREATMENT_MAPPINGS['color_treatments'].items():
+        if key.translate(treatment_parser._FOLD_TABLE) in folded:
+            return value, 'color'
+    for key, value in treatment_parser.TREATMENT_MAPPINGS['icon_treatments'].items():
+        if key.translate(treatment_parser._FOLD_TABLE) in folded:
+            return value, 'icon'
+    return token.title(), 'icon'
+
+
+class TreatmentMappingTest(unittest.TestCase):
+    def assert_matches_scan(self, token):
+        results = treatment_parser.enhanced_parse_treatment_text(f'26 {token}')
+        self.assertTrue(results, token)
+        parsed = results[0]
+        self.assertEqual((parsed['treatment'], parsed['type']), substring_scan(parsed['original']), token)
+
+    def test_every_key_resolves_like_the_substring_scan(self):
+        for category in ('color_treatments', 'icon_treatments'):
+            for key in treatment_parser.TREATMENT_MAPPINGS[category]:
+                with self.subTest(key=key):
+                    self.assert_matches_scan(key)
+
+    def test_exact_key_agrees_with_a_token_containing_it(self):
+        self.assertEqual(treatment_parser.enhanced_parse_treatment_text('26 extraction')[0]['treatment'],
+                         treatment_parser.enhanced_parse_treatment_text('26 extractions')[0]['treatment'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+import re
+
+# Enhanced treatment mappings - French dental terms to actions
+TREATMENT_MAPPINGS = {
+    # Color changes (crown, onlay, veneer)
+    'color_treatments': {
+        'cc': 'Couronne céramique',
+        'cci': 'Couronne sur implant',
+        'couronne': 'Couronne céramique',
+        'couronne ceramique': 'Couronne céramique',
+        'couronne sur implant': 'Couronne sur implant',
+        'onlay': 'Onlay',
+        'facette': 'Facette céramique',
+        'facette ceramique': 'Facette céramique',
+        'veneer': 'Facette céramique',
+        'f': 'Facette céramique',
+        'cpr': 'Couronne céramique',
+        'o': 'Onlay',
+        'ceram': 'Facette céramique',
+        'ceramique': 'Facette céramique'
+    },
+    # Icon treatments
+    'icon_treatments': {
+        'dem': 'Dévitalisation',
+        'devitalisation': 'Dévitalisation',
+        'tr': 'Traitement endodontique',
+        'traitement radiculaire': 'Traitement endodontique',
+        'traitement endodontique': 'Traitement endodontique',
+        'endo': 'Traitement endodontique',
+        'endodontie': 'Traitement endodontique',
+        'tenons': 'Tenons',
+        'tenon': 'Tenons',
+        'ma': 'Moignon adhésif',
+        'moignon adhesif': 'Moignon adhésif',
+        'extraction': 'Extraction',
+        'ext': 'Extraction',
+        'av': 'Extraction',
+        'avulsion': 'Extraction',
+        'abl': 'Extraction',
+        'ablation': 'Extraction',
+        'implant': 'Pose d\'implant',
+        'imp': 'Pose d\'implant',
+        'pose i': 'Pose d\'implant',
+        'pose d\'implant': 'Pose d\'implant',
+        'pose implant': 'Pose d\'implant',
+        'curtage': 'Curetage',
+        'curetage': 'Curetage',
+        'seance': 'Séance',
+        'bnv': 'Blanchissement interne',
+        'blanchiment interne': 'Blanchissement interne',
+        'blanchissement interne': 'Blanchissement interne',
+        'blanch': 'Blanchissement interne',
+        'blanchiment': 'Blanchissement interne',
+        'gbr': 'Greffe osseuse',
+        'greffe osseuse': 'Greffe osseuse',
+        'gc': 'Greffe gingivale',
+        'greffe gingivale': 'Greffe gingivale',
+        'sl': 'Sinus lift',
+        'sinus lift': 'Sinus lift',
+        'det': 'Détartrage',
+        'hd': 'Détartrage',
+        'detartrage': 'Détartrage',
+        'sf': 'Scellement de fissure',
+        'scellement de fissure': 'Scellement de fissure',
+        'dds': 'Dent de sagesse',
+        'dent de sagesse': 'Dent de sagesse',
+        'fil de cont': 'Fil de contention',
+        'fil de contention': 'Fil de contention',
+        'dem cc': 'Démonter couronne',
+        'te': 'Taille empreinte',
+        'taille empreinte': 'Taille empreinte',
+        'sc': 'Scellement',
+        'scellement': 'Scellement',
+        'empr': 'Empreinte',
+        'empreinte': 'Empreinte',
+        'post-op': 'Post opératoire',
+        'post op': 'Post opératoire',
+        'prov': 'Provisoire',
+        'provisoire': 'Provisoire',
+        'm': 'Composite mésial',
+        'mesial': 'Composite mésial',
+        'd': 'Composite distal',
+        'distal': 'Composite distal',
+        'mo': 'Composite mésio-occlusal',
+        'do': 'Composite occluso-distal',
+        'mod': 'Composite mésio-occluso-distal',
+        'l': 'Composite lingual',
+        'lingual': 'Composite lingual',
+        'p': 'Composite palatin',
+        'palatin': 'Composite palatin',
+        'v': 'Composite vestibulaire',
+        'vestibulaire': 'Composite vestibulaire'
+    }
+}
+
+# Accent folding so mappings only need ASCII keys ('seance' also matches 'séance')
+_FOLD_TABLE = str.maketrans({
+    'é': 'e', 'è': 'e', 'ê': 'e', 'à': 'a', 'â': 'a', 'ô': 'o',
+    'î': 'i', 'ï': 'i', 'ç': 'c', 'ù': 'u', 'û': 'u'
+})
+_FOLDED_COLOR = {k.translate(_FOLD_TABLE): v for k, v in TREATMENT_MAPPINGS['color_treatments'].items()}
+_FOLDED_ICON = {k.translate(_FOLD_TABLE): v for k, v in TREATMENT_MAPPINGS['icon_treatments'].items()}
+
+def _scan_treatment(folded):
+    """Resolve a folded treatment token to (name, type): color keys first, then icon keys, by substring"""
+    for key, value in _FOLDED_COLOR.items():
+        if key in folded:
+            return value, 'color'
+    for key, value in _FOLDED_ICON.items():
+        if key in folded:
+            return value, 'icon'
+    return None
+
+# Fast path for tokens that are exactly a mapping key, precomputed from the scan
+# itself so both paths always agree (e.g. 'extraction' contains the color key 'o')
+_EXACT_TREATMENTS = {key: _scan_treatment(key) for key in (*_FOLDED_COLOR, *_FOLDED_ICON)}
+
+def parse_tooth_range(tooth_str):
+    """Parse tooth ranges like '12-22' or '11 à 22'"""
+    tooth_str = tooth_str.strip()
+    
+    # Handle ranges with dash: 12-22
+    if '-' in tooth_str:
+        start, end = tooth_str.split('-')
+        start, end = int(start.strip()), int(end.strip())
+        return range(start, end + 1)
+    
+    # Handle ranges with 'à': 11 à 22
+    elif ' à ' in tooth_str:
+        start, end = tooth_str.split(' à ')
+        start, end = int(start.strip()), int(end.strip())
+        return range(start, end + 1)
+    
+    # Single tooth
+    else:
+        return (int(tooth_str),)
+
+def enhanced_parse_treatment_text(text):
+    """Enhanced parsing with better regex"""
+    results = []
+    
+    # Clean the text
+    text = text.lower().strip()
+    
+    # Enhanced regex patterns
+    patterns = [
+        # Complex pattern: Plan de TT 11 AV + implant + CC; 22 Implant + CC
+        r'plan\s+de\s+t+\s+([^;]+)',
+        # Simple pattern: 26 dém. CC + dém. tenons + TR
+        r'(\d+(?:\s*[-à]\s*\d+)?)\s*[:\s]*([^;]+)',
+        # Alternative pattern: Pour la 26: treatments
+        r'pour\s+la\s+(\d+(?:\s*[-à]\s*\d+)?)\s*[:\s]*([^;]+)',
+    ]
+    
+    for pattern in patterns:
+        matches = re.findall(pattern, text)
+        for match in matches:
+            if len(match) == 2:
+                tooth_part, treatment_part = match
+                
+                # Parse tooth numbers (handle ranges)
+                try:
+                    tooth_numbers = parse_tooth_range(tooth_part)
+                except ValueError:
+                    continue
+                
+                # Parse treatments
+                treatments = [t.strip() for t in re.split(r'[+&,]', treatment_part) if t.strip()]
+                
+                for tooth_num in tooth_numbers:
+                    for treatment in treatments:
+                        treatment = treatment.strip()
+                        if treatment:
+                            # Determine treatment type and normalize name
+                            folded = treatment.translate(_FOLD_TABLE)
+                            if folded in _EXACT_TREATMENTS:
+                                match = _EXACT_TREATMENTS[folded]
+                            else:
+                                match = _scan_treatment(folded)
+                            
+                            # If no mapping found, use original treatment
+                            if match:
+                                normalized_treatment, treatment_type = match
+                            else:
+                                normalized_treatment, treatment_type = treatment.title(), 'icon'
+                            
+                            results.append({
+                                'tooth': str(tooth_num),
+                                'treatment': normalized_treatment,
+                                'type': treatment_type,
+                                'original': treatment
+                            })
+    
+    return results
+
+def is_valid_tooth_number(tooth_number):
+    """Validate tooth number according to FDI system"""
+    try:
+        tooth_num = int(tooth_number)
+        # Valid FDI tooth numbers: 11-18, 21-28, 31-38, 41-48
+        valid_ranges = [
+            (11, 18), (21, 28), (31, 38), (41, 48)
+        ]
+        
+        for start, end in valid_ranges:
+            if start <= tooth_num <= end:
+                return True
+        return False
+    except ValueError:
+        return False